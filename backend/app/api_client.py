@@ -1,18 +1,84 @@
 """API client for Shinagawa reservation system."""
+import hashlib
+import queue
+import threading
+import ijson
+import orjson
 import requests
-from typing import Dict, List, Optional
-from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib3.util.retry import Retry
+from concurrent.futures import Future, ThreadPoolExecutor
+from cachetools import LRUCache, TTLCache
+from typing import Callable, Dict, Iterator, List, Optional
+from datetime import datetime
+from operator import itemgetter
+from types import MappingProxyType
 import logging
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# (output key, API camelCase key, calendar snake_case key, coerce to int)
+_SLOT_FIELDS = (
+    ('use_ymd', 'useYmd', 'use_ymd', False),
+    ('bcd', 'bcd', 'bcd', False),
+    ('icd', 'icd', 'icd', False),
+    ('bcd_name', 'bcdNm', 'bcd_name', False),
+    ('icd_name', 'icdNm', 'icd_name', False),
+    ('start_time', 'sTime', 'start_time', True),
+    ('end_time', 'eTime', 'end_time', True),
+    ('start_time_display', 'sJTime', 'start_time_display', False),
+    ('end_time_display', 'eJTime', 'end_time_display', False),
+    ('pps_cd', 'ppsCd', 'pps_cd', True),
+    ('pps_cls_cd', 'ppsClsCd', 'pps_cls_cd', True),
+    ('week_flg', 'weekFlg', 'week_flg', True),
+    ('holiday_flg', 'holidayFlg', 'holiday_flg', True),
+    ('field_cnt', 'fieldCnt', 'field_cnt', True),
+    ('park_name', 'park_name', 'park_name', False),
+    ('park_priority', 'park_priority', 'park_priority', False),
+)
+_SLOT_KEYS = tuple(key for key, _, _, _ in _SLOT_FIELDS)
+_INT_SLOT_KEYS = tuple(key for key, _, _, is_int in _SLOT_FIELDS if is_int)
+# Pulls every field of a complete API-format slot in a single C-level call
+_GET_API_SLOT_FIELDS = itemgetter(*(camel_key for _, camel_key, _, _ in _SLOT_FIELDS))
+
+# Fixed fields of the date-based search form; per-call fields are merged in
+_DATE_SEARCH_BASE_DATA = MappingProxyType({
+    'date': 4,  # 1か月
+    'selectIcd': '',  # Empty for all facilities
+    'dayofweek': [],
+    'timezone': [],
+    'displayNo': 'prwrc2000',
+    'dayofweekClearFlg': 0,
+    'timezoneClearFlg': 0
+})
+
+# Purpose code of テニス, the only activity scanned
+_TENNIS_PURPOSE_CODE = "31000000_31011700"
+
+
+def _date_search_data(area_code: str, purpose_code: str, start_date: str,
+                      days: int, offset: int, limit: int) -> Dict:
+    """Form body of a date-based search."""
+    return {
+        **_DATE_SEARCH_BASE_DATA,
+        'daystart': start_date,
+        'days': days,
+        'selectAreaBcd': area_code,
+        'selectPpsClPpscd': purpose_code,
+        'offset': offset,
+        'limit': limit,
+    }
+
 
 class ShinagawaAPIClient:
     """Client for interacting with Shinagawa reservation API."""
     
     def __init__(self, cookies: Optional[Dict[str, str]] = None):
         self.base_url = settings.base_url
+        self._date_url = f"{self.base_url}/rsvWOpeUnreservedSearchAjaxAction.do"
+        self._facility_url = f"{self.base_url}/rsvWOpeInstSrchVacantAjaxAction.do"
         self.session = requests.Session()
         self.session.headers.update({
             'X-Requested-With': 'XMLHttpRequest',
@@ -22,23 +88,129 @@ class ShinagawaAPIClient:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/143.0.0.0 Safari/537.36',
             'Accept': 'application/json, text/javascript, */*; q=0.01',
             'Accept-Language': 'en,en-US;q=0.9',
-            'Accept-Encoding': 'gzip, deflate, br, zstd',
+            # Only advertise codecs urllib3 can decode natively (br/zstd need
+            # the brotli/zstandard extensions), so response.content is always
+            # plain bytes ready for orjson without a text-decoding pass
+            'Accept-Encoding': ACCEPT_ENCODING,
             'Sec-Fetch-Dest': 'empty',
             'Sec-Fetch-Mode': 'cors',
             'Sec-Fetch-Site': 'same-origin',
+            'Connection': 'keep-alive',
         })
         
+        # Larger keep-alive pool so concurrent park/page fetches don't queue
+        # on connection checkout; the availability POSTs are read-only
+        # searches, so they are safe to retry on transient server errors.
+        adapter = HTTPAdapter(
+            pool_connections=settings.api_max_connections,
+            pool_maxsize=settings.api_max_connections,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=[500, 502, 503, 504],
+                allowed_methods=frozenset(['GET', 'POST'])
+            )
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # Caps in-flight requests across all concurrent park/page fetches so
+        # they reuse pooled keep-alive connections instead of opening more
+        self._request_slots = threading.BoundedSemaphore(settings.api_max_connections)
+        
         if cookies:
             self.session.cookies.update(cookies)
+        
+        # Short-lived response cache keyed by request parameters. Cached
+        # responses are handed to every caller as-is, so they are read-only.
+        self._cache = TTLCache(maxsize=512, ttl=settings.api_cache_ttl)
+        # Outlives the TTL: (etag, last_modified, body_digest, parsed) per key,
+        # used to revalidate expired entries instead of re-parsing them
+        self._validators = LRUCache(maxsize=512)
+        self._cache_lock = threading.Lock()
+        
+        # Fetches currently on the wire, so identical concurrent queries share one
+        self._inflight: Dict[tuple, Future] = {}
+        self._inflight_lock = threading.Lock()
+        
+        # Long-lived workers shared by every scan: one per park, plus a page
+        # pool sized to the connection limit for pagination prefetch. Page
+        # tasks never wait on other tasks, so park workers blocking on them
+        # cannot deadlock, and total threads stay fixed however many parks
+        # or scans run at once.
+        self._park_executor = ThreadPoolExecutor(
+            max_workers=8, thread_name_prefix='park-scan')
+        self._page_executor = ThreadPoolExecutor(
+            max_workers=settings.api_max_connections, thread_name_prefix='page-fetch')
+    
+    def _get_cached(self, key: tuple) -> Optional[Dict]:
+        """Return a cached response for key, or None on miss."""
+        with self._cache_lock:
+            return self._cache.get(key)
+    
+    def _set_cached(self, key: tuple, response: Dict):
+        """Store a parsed response under key."""
+        with self._cache_lock:
+            self._cache[key] = response
+    
+    def _get_validators(self, key: tuple) -> Optional[tuple]:
+        """Return (etag, last_modified, body_digest, parsed) for key, if known."""
+        with self._cache_lock:
+            return self._validators.get(key)
+    
+    def _set_validators(self, key: tuple, response: requests.Response, body_digest: str, parsed: Dict):
+        """Remember how to revalidate the response stored under key."""
+        with self._cache_lock:
+            self._validators[key] = (
+                response.headers.get('ETag'),
+                response.headers.get('Last-Modified'),
+                body_digest,
+                parsed
+            )
+    
+    def _single_flight(self, key: tuple, fetch: Callable[[], Dict]) -> Dict:
+        """Run fetch once for concurrent callers asking for the same key.
+        
+        The first caller performs the request; callers arriving while it is
+        in flight wait for and share its result (or exception).
+        """
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        
+        if not owner:
+            return future.result()
+        
+        try:
+            result = fetch()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+    
+    def _post(self, url: str, **kwargs) -> requests.Response:
+        """POST on the shared session, bounded by the connection limit."""
+        with self._request_slots:
+            return self.session.post(url, timeout=settings.api_timeout, **kwargs)
     
     def update_cookies(self, cookies: Dict[str, str]):
         """Update session cookies."""
         self.session.cookies.update(cookies)
+        # Responses fetched under the old session may no longer apply
+        with self._cache_lock:
+            self._cache.clear()
+            self._validators.clear()
     
     def get_date_based_availability(
         self,
         area_code: str = "1400_0",
-        purpose_code: str = "31000000_31011700",
+        purpose_code: str = _TENNIS_PURPOSE_CODE,
         start_date: Optional[str] = None,
         days: int = 31,
         offset: int = 0,
@@ -55,44 +227,68 @@ class ShinagawaAPIClient:
             limit: Maximum results to return
             
         Returns:
-            JSON response with availability data
+            JSON response with availability data, shared with the response
+            cache: copy before modifying it
         """
         if not start_date:
             start_date = datetime.now().strftime("%Y-%m-%d")
         
-        url = f"{self.base_url}/rsvWOpeUnreservedSearchAjaxAction.do"
+        key = ('date', area_code, purpose_code, start_date, days, offset, limit)
+        cached = self._get_cached(key)
+        if cached is not None:
+            return cached
         
-        data = {
-            'date': 4,  # 1か月
-            'daystart': start_date,
-            'days': days,
-            'selectAreaBcd': area_code,
-            'selectIcd': '',  # Empty for all facilities
-            'selectPpsClPpscd': purpose_code,
-            'dayofweek': [],
-            'timezone': [],
-            'offset': offset,
-            'limit': limit,
-            'displayNo': 'prwrc2000',
-            'dayofweekClearFlg': 0,
-            'timezoneClearFlg': 0
-        }
+        data = _date_search_data(area_code, purpose_code, start_date, days, offset, limit)
+        
+        return self._single_flight(
+            key, lambda: self._fetch_date_based_availability(key, area_code, data)
+        )
+    
+    def _fetch_date_based_availability(self, key: tuple, area_code: str, data: Dict) -> Dict:
+        """POST a date-based search and cache the parsed response under key."""
+        # Revalidate a previously seen response rather than refetching blind
+        validators = self._get_validators(key)
+        headers = {}
+        if validators:
+            etag, last_modified, _, _ = validators
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
         
         try:
-            response = self.session.post(url, data=data, timeout=settings.api_timeout)
+            response = self._post(self._date_url, data=data, headers=headers)
             response.raise_for_status()
             
-            # Check if response is empty
-            if not response.text or not response.text.strip():
+            if response.status_code == 304 and validators:
+                result = validators[3]
+                self._set_cached(key, result)
+                return result
+            
+            # Check if response is empty (on raw bytes, avoiding a text decode)
+            body = response.content
+            if not body or not body.strip():
                 logger.warning(f"Empty response from API for area {area_code}")
                 return {'results': [], 'next': 0}
             
+            # Servers that ignore conditional POSTs still let us skip the
+            # parse when the body is byte-for-byte unchanged
+            body_digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+            if validators and validators[2] == body_digest:
+                result = validators[3]
+                self._set_cached(key, result)
+                return result
+            
             # Try to parse JSON
             try:
-                return response.json()
-            except ValueError as e:
-                logger.error(f"Invalid JSON response: {response.text[:200]}")
+                result = orjson.loads(body)
+            except orjson.JSONDecodeError:
+                logger.error(f"Invalid JSON response: {body[:200].decode('utf-8', 'replace')}")
                 return {'results': [], 'next': 0}
+            
+            self._set_cached(key, result)
+            self._set_validators(key, response, body_digest, result)
+            return result
         except Exception as e:
             logger.error(f"Error fetching date-based availability: {e}")
             raise
@@ -116,7 +312,10 @@ class ShinagawaAPIClient:
         if not start_day:
             start_day = int(datetime.now().strftime("%Y%m%d"))
         
-        url = f"{self.base_url}/rsvWOpeInstSrchVacantAjaxAction.do"
+        key = ('facility', bcd, icd, start_day)
+        cached = self._get_cached(key)
+        if cached is not None:
+            return cached
         
         # Note: Need to discover exact parameters from actual requests
         data = {
@@ -125,58 +324,175 @@ class ShinagawaAPIClient:
             'startDay': start_day,
         }
         
+        return self._single_flight(
+            key, lambda: self._fetch_facility_based_availability(key, data)
+        )
+    
+    def _fetch_facility_based_availability(self, key: tuple, data: Dict) -> Dict:
+        """POST a facility-based search and cache the parsed response under key."""
         try:
-            response = self.session.post(url, data=data, timeout=settings.api_timeout)
+            response = self._post(self._facility_url, data=data)
             response.raise_for_status()
-            return response.json()
+            result = orjson.loads(response.content)
+            self._set_cached(key, result)
+            return result
         except Exception as e:
             logger.error(f"Error fetching facility-based availability: {e}")
             raise
     
-    def scan_all_parks(self) -> List[Dict]:
-        """Scan all target parks for availability.
+    def _iter_park_pages(self, park: Dict) -> Iterator[List[Dict]]:
+        """Yield each page of availability for one park as it arrives.
         
-        Returns:
-            List of all available slots across all parks
+        Slots are tagged with the park's name and priority on copies, since
+        the responses themselves are shared with the cache.
         """
-        all_slots = []
+        meta = {'park_name': park['name'], 'park_priority': park['priority']}
+        response = self.get_date_based_availability(
+            area_code=park['area'],
+            purpose_code=_TENNIS_PURPOSE_CODE
+        )
         
-        for park in settings.target_parks:
-            try:
-                response = self.get_date_based_availability(
-                    area_code=park['area'],
-                    purpose_code="31000000_31011700"
+        if 'results' in response:
+            yield [{**slot, **meta} for slot in response['results']]
+        
+        # Handle pagination if needed. The API only says whether more pages
+        # follow, so prefetch a window of offsets concurrently and stop at
+        # the first page that reports no successor.
+        if 'next' in response and response['next'] > 0:
+            offset = limit = 100
+            window = max(1, settings.api_page_prefetch)
+            while True:
+                offsets = [offset + i * limit for i in range(window)]
+                pages = self._page_executor.map(
+                    lambda page_offset: self.get_date_based_availability(
+                        area_code=park['area'],
+                        offset=page_offset,
+                        limit=limit
+                    ),
+                    offsets
                 )
+                has_more = True
+                for response in pages:
+                    if 'results' in response:
+                        yield [{**slot, **meta} for slot in response['results']]
+                    if 'next' not in response or response['next'] == 0:
+                        has_more = False
+                        break
+                if not has_more:
+                    break
+                offset += window * limit
+    
+    def _iter_streamed_park_pages(self, park: Dict) -> Iterator[List[Dict]]:
+        """Yield one park's slots while each page is still downloading.
+        
+        Bodies are parsed incrementally with ijson and each slot is yielded,
+        as a one-slot page tagged with the park's name and priority, once
+        it is complete. Pages are requested one after another because a
+        page's 'next' is only known once it has been read. These responses
+        bypass the response cache.
+        """
+        meta = {'park_name': park['name'], 'park_priority': park['priority']}
+        start_date = datetime.now().strftime("%Y-%m-%d")
+        offset = 0
+        limit = 100
+        while True:
+            data = _date_search_data(park['area'], _TENNIS_PURPOSE_CODE,
+                                     start_date, 31, offset, limit)
+            next_page = 0
+            # The consumer of these pages is _pump_park_pages, which never
+            # blocks, so the request slot is held for the download only
+            with self._request_slots, self.session.post(
+                self._date_url, data=data, stream=True, timeout=settings.api_timeout
+            ) as response:
+                response.raise_for_status()
+                response.raw.decode_content = True
                 
-                if 'results' in response:
-                    for slot in response['results']:
-                        slot['park_name'] = park['name']
-                        slot['park_priority'] = park['priority']
-                        all_slots.append(slot)
-                
-                # Handle pagination if needed
-                if 'next' in response and response['next'] > 0:
-                    offset = limit = 100
-                    while response.get('next', 0) > 0:
-                        response = self.get_date_based_availability(
-                            area_code=park['area'],
-                            offset=offset,
-                            limit=limit
-                        )
-                        if 'results' in response:
-                            for slot in response['results']:
-                                slot['park_name'] = park['name']
-                                slot['park_priority'] = park['priority']
-                                all_slots.append(slot)
-                        offset += limit
-                        if 'next' not in response or response['next'] == 0:
-                            break
-                            
-            except Exception as e:
-                logger.error(f"Error scanning park {park['name']}: {e}")
-                continue
+                builder = None
+                for prefix, event, value in ijson.parse(response.raw, use_float=True):
+                    if builder is not None:
+                        builder.event(event, value)
+                        if prefix == 'results.item' and event == 'end_map':
+                            slot = builder.value
+                            slot.update(meta)
+                            yield [slot]
+                            builder = None
+                    elif prefix == 'results.item' and event == 'start_map':
+                        builder = ijson.ObjectBuilder()
+                        builder.event(event, value)
+                    elif prefix == 'next' and event == 'number':
+                        next_page = value
+            if not next_page:
+                break
+            offset += limit
+    
+    def _pump_park_pages(self, park_pages: Iterator[List[Dict]], park: Dict,
+                         pages: queue.SimpleQueue, stop: threading.Event):
+        """Feed one park's pages into pages, ending with (park, None).
         
-        return all_slots
+        A failure is passed on as (park, exception) in place of the end
+        marker. Stops early once stop is set.
+        """
+        try:
+            for page in park_pages:
+                if stop.is_set():
+                    break
+                pages.put((park, page))
+        except Exception as e:
+            pages.put((park, e))
+            return
+        pages.put((park, None))
+    
+    def iter_all_slots(self, normalize: bool = True,
+                       stream: bool = False) -> Iterator[Dict]:
+        """Yield slots for all target parks as their pages arrive.
+        
+        Every park is scanned at once on the park executor and each page is
+        handed over as soon as it is fetched, so the first slots are ready
+        after one round trip and no combined list is built. Pages come in
+        arrival order, not park order. A park that fails is logged and
+        skipped.
+        
+        Args:
+            normalize: Yield normalize_slot_data() output rather than the
+                raw API slots tagged with park_name/park_priority
+            stream: Parse each page while it downloads instead of reading
+                it through the response cache (see _iter_streamed_park_pages)
+        """
+        # Thread pool rather than asyncio.run(), which cannot be called
+        # from code already running inside the FastAPI event loop
+        parks = settings.target_parks
+        pages = queue.SimpleQueue()
+        stop = threading.Event()
+        park_pages = self._iter_streamed_park_pages if stream else self._iter_park_pages
+        for park in parks:
+            self._park_executor.submit(
+                self._pump_park_pages, park_pages(park), park, pages, stop)
+        
+        try:
+            remaining = len(parks)
+            while remaining:
+                park, page = pages.get()
+                if page is None:
+                    remaining -= 1
+                elif isinstance(page, Exception):
+                    logger.error(f"Error scanning park {park['name']}: {page}")
+                    remaining -= 1
+                elif normalize:
+                    yield from map(self.normalize_slot_data, page)
+                else:
+                    yield from page
+        finally:
+            # Also runs when the consumer stops early: parks still being
+            # scanned stop after their current page
+            stop.set()
+    
+    def scan_all_parks(self) -> List[Dict]:
+        """Scan all target parks for availability.
+        
+        Returns:
+            List of all available slots across all parks, as raw API slots
+        """
+        return list(self.iter_all_slots(normalize=False))
     
     def normalize_slot_data(self, slot: Dict) -> Dict:
         """Normalize slot data from API response or calendar extraction to standard format.
@@ -185,38 +501,46 @@ class ShinagawaAPIClient:
         - API format: camelCase keys (useYmd, bcdNm, sTime, etc.)
         - Calendar extraction format: snake_case keys (use_ymd, bcd_name, start_time, etc.)
         """
-        # Helper to get value from either format
-        def get_value(camel_key, snake_key, default=None):
-            if camel_key in slot:
-                return slot[camel_key]
-            return slot.get(snake_key, default)
-        
-        # Helper to convert to int safely
-        def to_int(value, default=0):
+        try:
+            normalized = dict(zip(_SLOT_KEYS, _GET_API_SLOT_FIELDS(slot)))
+        except KeyError:
+            # Calendar extraction or partial API slot: resolve field by field
+            normalized = {
+                key: slot[camel_key] if camel_key in slot else slot.get(snake_key)
+                for key, camel_key, snake_key, _ in _SLOT_FIELDS
+            }
+        
+        for key in _INT_SLOT_KEYS:
+            value = normalized[key]
+            if type(value) is int:
+                # Common case: the API already sends ints
+                continue
             if value is None:
-                return default
-            try:
-                return int(value)
-            except (ValueError, TypeError):
-                return default
-        
-        return {
-            'use_ymd': get_value('useYmd', 'use_ymd'),
-            'bcd': slot.get('bcd'),
-            'icd': slot.get('icd'),
-            'bcd_name': get_value('bcdNm', 'bcd_name'),
-            'icd_name': get_value('icdNm', 'icd_name'),
-            'start_time': to_int(get_value('sTime', 'start_time')),
-            'end_time': to_int(get_value('eTime', 'end_time')),
-            'start_time_display': get_value('sJTime', 'start_time_display'),
-            'end_time_display': get_value('eJTime', 'end_time_display'),
-            'pps_cd': to_int(get_value('ppsCd', 'pps_cd'), 0),
-            'pps_cls_cd': to_int(get_value('ppsClsCd', 'pps_cls_cd'), 0),
-            'week_flg': to_int(get_value('weekFlg', 'week_flg'), 0),
-            'holiday_flg': to_int(get_value('holidayFlg', 'holiday_flg'), 0),
-            'field_cnt': to_int(get_value('fieldCnt', 'field_cnt'), 0),
-            'park_name': slot.get('park_name'),
-            'park_priority': slot.get('park_priority'),
-            'raw_data': slot
-        }
+                normalized[key] = 0
+            else:
+                try:
+                    normalized[key] = int(value)
+                except (ValueError, TypeError):
+                    normalized[key] = 0
+        
+        normalized['raw_data'] = slot
+        return normalized
 
+
+_client: Optional[ShinagawaAPIClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client(cookies: Optional[Dict[str, str]] = None) -> ShinagawaAPIClient:
+    """Return the process-wide API client, creating it on first use.
+    
+    Sharing one client keeps its pooled connections and caches alive across
+    request handlers. Cookies, if given, are applied to the shared session.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ShinagawaAPIClient(cookies)
+        elif cookies:
+            _client.update_cookies(cookies)
+        return _client
@@ -1,13 +1,229 @@
 """Booking handler for reservation flow."""
+import asyncio
 import logging
-from typing import Dict, Optional, List
-from playwright.async_api import Page
+import re
+import time
+import weakref
+from typing import Callable, Dict, Optional, List, Tuple
+from playwright.async_api import (
+    Locator, Page,
+    TimeoutError as PlaywrightTimeoutError
+)
 
 from app.form_utils import FormUtils
 from app.network_capture import NetworkCapture
 
 logger = logging.getLogger(__name__)
 
+# Elements that only exist once each booking page has rendered; waiting on
+# these replaces blanket networkidle + fixed sleeps between steps
+TERMS_OR_CONFIRMATION_ANCHOR = 'label[for="ruleFg_1"], input[name*="applyNum"], input[id^="peoples"]'
+CONFIRMATION_PAGE_ANCHOR = 'input[name*="applyNum"], input[id^="peoples"]'
+COMPLETION_PAGE_ANCHOR = 'button[onclick*="gRsvCreditInitListAction"], button:has-text("未入金予約の確認・支払へ")'
+PAYMENT_PAGE_ANCHOR = 'button[onclick*="gRsvWOpeHomeAction"], button:has-text("もどる")'
+# Any page the final 予約 can land on: completion, the confirmation page
+# shown again (validation failure) or the system error page
+FINAL_RESERVE_OUTCOME_ANCHOR = ', '.join((
+    COMPLETION_PAGE_ANCHOR,
+    CONFIRMATION_PAGE_ANCHOR,
+    'body:has-text("pawfa1000")',
+))
+
+# Candidate selectors for each booking step, in priority order
+_BTN_GO_SELECTORS = (
+    '#btn-go',  # Primary selector
+    'button#btn-go',
+    'button.btn-go:has-text("予約")',
+)
+AGREEMENT_SELECTORS = (
+    'label[for="ruleFg_1"]',
+    'label.btn.radiobtn[for="ruleFg_1"]',
+    'label:has-text("利用規約に同意する")',
+    'input[type="radio"][value="1"][name*="rule"]',
+    'input[type="radio"][id="ruleFg_1"]',
+    'input[value*="同意する"]',
+    'input[name*="agree"]',
+)
+_CONFIRM_SELECTORS = (
+    '#btn-go',
+    'button#btn-go',
+    'button:has-text("確認")',
+    'button[type="submit"]:has-text("確認")',
+    'button[onclick*="gRsvWInstUseruleRsvApplyAction"]',
+)
+_FINAL_RESERVE_SELECTORS = (
+    '#btn-go',
+    'button#btn-go',
+    'button:has-text("予約")',
+    'button[onclick*="gRsvWInstRsvApplyAction"]',
+    'button[onclick*="checkTextValue"]',
+)
+_PAYMENT_BUTTON_SELECTORS = (
+    '#btn-go',  # Primary selector
+    'button#btn-go',
+    'button:has-text("未入金予約の確認・支払へ")',
+    'button[onclick*="gRsvCreditInitListAction"]',
+    'button[onclick*="doAction"][onclick*="gRsvCreditInitListAction"]',
+)
+_BACK_BUTTON_SELECTORS = (
+    'button.btn-back:has-text("もどる")',
+    'button:has-text("もどる")',
+    'button[onclick*="gRsvWOpeHomeAction"]',
+    'button[onclick*="doAction"][onclick*="gRsvWOpeHomeAction"]',
+    '.btn-back',
+    'button.btn-back',
+)
+
+# URL fragments identifying each page of the booking flow
+_TERMS_URL_TOKENS = ('rsvWOpeReservedApplyAction',)
+_CONFIRMATION_URL_TOKENS = ('rsvWInstUseruleRsvApplyAction', 'rsvWInstRsvApplyAction')
+_COMPLETION_URL_TOKENS = ('rsvWInstRsvApplyAction',)
+_PAYMENT_URL_TOKENS = ('rsvWRsvGetNotPaymentRsvDataListAction', 'rsvWCreditInitListAction')
+
+# onclick handlers that identify each step's button
+_RESERVE_ONCLICK_TOKENS = ('gRsvWOpeReservedApplyAction',)
+_FINAL_RESERVE_ONCLICK_TOKENS = ('gRsvWInstRsvApplyAction',)
+_PAYMENT_ONCLICK_TOKENS = ('gRsvCreditInitListAction',)
+_BACK_ONCLICK_TOKENS = ('gRsvWOpeHomeAction',)
+
+# The pages that follow the '予約' click, in order. Each step is detected by
+# URL or title (after waiting for 'anchor'), optionally prepared by the
+# 'prepare' method, and left by clicking its button ('click' names a custom
+# click method). A failed click ends the flow unless the step is optional.
+_BOOKING_STEPS = (
+    {
+        'name': 'Terms of Use',
+        'anchor': None,
+        'url_tokens': _TERMS_URL_TOKENS,
+        'title_token': '利用規約',
+        'prepare': 'agree_to_terms',
+        'label': '確認',
+        'selectors': _CONFIRM_SELECTORS,
+        'onclick_tokens': (),
+        'text_tokens': (),
+        'click': None,
+        'next_anchor': CONFIRMATION_PAGE_ANCHOR,
+        'required': True,
+    },
+    {
+        'name': 'reservation confirmation',
+        'anchor': CONFIRMATION_PAGE_ANCHOR,
+        'url_tokens': _CONFIRMATION_URL_TOKENS,
+        'title_token': '予約内容確認',
+        'prepare': '_fill_user_counts',
+        'label': '予約',
+        'selectors': _FINAL_RESERVE_SELECTORS,
+        'onclick_tokens': _FINAL_RESERVE_ONCLICK_TOKENS,
+        'text_tokens': (),
+        'click': '_click_final_reserve',
+        'next_anchor': FINAL_RESERVE_OUTCOME_ANCHOR,
+        'required': True,
+    },
+    {
+        'name': 'reservation completion',
+        'anchor': COMPLETION_PAGE_ANCHOR,
+        'url_tokens': _COMPLETION_URL_TOKENS,
+        'title_token': '予約完了',
+        'prepare': None,
+        'label': '未入金予約の確認・支払へ',
+        'selectors': _PAYMENT_BUTTON_SELECTORS,
+        'onclick_tokens': _PAYMENT_ONCLICK_TOKENS,
+        'text_tokens': ('未入金予約の確認・支払へ',),
+        'click': None,
+        'next_anchor': PAYMENT_PAGE_ANCHOR,
+        'required': True,
+    },
+    {
+        'name': 'payment',
+        'anchor': None,
+        'url_tokens': _PAYMENT_URL_TOKENS,
+        'title_token': '未入金予約の確認・支払',
+        'prepare': None,
+        'label': 'もどる',
+        'selectors': _BACK_BUTTON_SELECTORS,
+        'onclick_tokens': _BACK_ONCLICK_TOKENS,
+        'text_tokens': ('もどる',),
+        'click': None,
+        'next_anchor': None,
+        'required': False,
+    },
+)
+
+# Reservation number: labelled in the page text, or in element text where a
+# labelled match (group 1 set) wins over the first bare 10-digit run
+_RES_NUM_RE = re.compile(r'(予約番号[：:]\s*)?(\d{10})')
+_RES_NUM_CTX_RE = re.compile(r'予約番号[：:]\s*(\d{10})')
+_RES_NUM_SELECTOR = '[class*="reservation"], td:has-text("予約番号") + td'
+
+# Window property set on the confirmation page right before the final 予約
+# click; a document without it is the page the click navigated to
+_RESERVE_CLICK_MARKER = '__bookingReserveClicked'
+
+# Polled from the click until the next document is parsed: resolves with the
+# labelled reservation number as soon as it is rendered, or with
+# {number: null} once the new page is loaded without one
+_RESERVATION_NUMBER_WAIT_JS = r"""(marker) => {
+    const text = document.body ? document.body.innerText : '';
+    const m = text.match(/予約番号[：:]\s*(\d{10})/);
+    if (m) return {number: m[1]};
+    if (window[marker] || document.readyState === 'loading') return null;
+    return {number: null};
+}"""
+
+# How long a page text snapshot is reused when the page has not navigated
+_CONTENT_CACHE_TTL = 2.0
+
+# Rendered text of the page: tags and attributes are dropped in the browser,
+# so far less crosses CDP than with page.content()
+_BODY_TEXT_JS = "() => document.body ? document.body.innerText : ''"
+
+# Attribute carrying the index of each element reported by _PROBE_SELECTORS_JS
+_PROBE_TARGET_ATTR = 'data-booking-probe'
+
+# In-page helper shared by the scripts that test selector lists: lazily
+# yields the elements matching a selector. document.querySelectorAll does
+# not understand Playwright's :has-text(), so that suffix is emulated as
+# "base selector + text contains". Throws on invalid CSS.
+SELECTOR_MATCHES_JS = r"""function* selectorMatches(selector) {
+    const m = selector.match(/^(.*?):has-text\("(.*)"\)$/);
+    for (const el of document.querySelectorAll(m ? (m[1] || '*') : selector)) {
+        if (!m || (el.innerText || el.textContent || '').includes(m[2])) yield el;
+    }
+}"""
+
+# Probes a list of selectors in one round trip and reports the first match
+# of each. An element already reported under an earlier selector (e.g.
+# '#btn-go' vs 'button#btn-go') is skipped. Each reported element is marked
+# with _PROBE_TARGET_ATTR set to its index in the result, so the caller
+# clicks exactly the element that was checked.
+_PROBE_SELECTORS_JS = r"""(selectors) => {
+    """ + SELECTOR_MATCHES_JS + r"""
+    const attr = '""" + _PROBE_TARGET_ATTR + r"""';
+    document.querySelectorAll('[' + attr + ']').forEach(el => el.removeAttribute(attr));
+    const found = [];
+    const seen = new Set();
+    for (const selector of selectors) {
+        try {
+            for (const el of selectorMatches(selector)) {
+                if (seen.has(el)) continue;
+                seen.add(el);
+                el.setAttribute(attr, String(found.length));
+                found.push({
+                    probe: found.length,
+                    selector: selector,
+                    onclick: el.getAttribute('onclick') || '',
+                    text: el.innerText || el.textContent || '',
+                    disabled: el.hasAttribute('disabled')
+                });
+                break;
+            }
+        } catch (e) {
+            continue;
+        }
+    }
+    return found;
+}"""
+
 
 class BookingHandler:
     """Handles the booking/reservation flow."""
@@ -22,7 +238,245 @@ class BookingHandler:
         """
         self.enable_network_capture = enable_network_capture
         self.network_capture: Optional[NetworkCapture] = None
+        
+        # Confirmation dialogs are accepted by one persistent listener per page
+        self._dialog_pages = weakref.WeakSet()
+        self._dialog_handled = asyncio.Event()
+        
+        # page -> (monotonic time, body text); dropped when the page navigates
+        self._content_cache = weakref.WeakKeyDictionary()
+        self._content_pages = weakref.WeakSet()
+        
+        # Network capture writes still in flight (held so they are not GC'd)
+        self._background_tasks = set()
+        
+        # Set just before the final 予約 click: from then on the site may
+        # hold the reservation even if the attempt fails. Cleared per attempt.
+        self.final_submit_clicked = asyncio.Event()
+    
+    async def _accept_dialog(self, dialog):
+        """Accept the reservation confirmation dialog (or any other dialog)."""
+        dialog_message = dialog.message
+        logger.info("JavaScript dialog detected: %s", dialog_message)
+        if "予約申込処理を行います" in dialog_message or "よろしいですか" in dialog_message:
+            logger.info("Accepting reservation confirmation dialog...")
+        else:
+            logger.warning(
+                "Unexpected dialog message: %s, accepting anyway", dialog_message
+            )
+        await dialog.accept()
+        self._dialog_handled.set()
+    
+    def _save_network_capture(self, filename: str,
+                              template_filename: Optional[str] = None):
+        """Stop network capture and write its results in the background.
+        
+        The JSON dump, API template and summary run in worker threads from a
+        task the booking flow does not wait on.
+        
+        Args:
+            filename: Output file for the captured requests
+            template_filename: Output file for the API template; the summary
+                is printed only when this is given
+        """
+        capture = self.network_capture
+        capture.stop_capture()
+        task = asyncio.create_task(
+            self._write_network_capture(capture, filename, template_filename))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    @staticmethod
+    async def _write_network_capture(capture: NetworkCapture, filename: str,
+                                     template_filename: Optional[str]):
+        """Write capture files off the event loop (see _save_network_capture)."""
+        writes = [asyncio.to_thread(capture.save_to_file, filename)]
+        if template_filename:
+            writes.append(
+                asyncio.to_thread(capture.save_api_template, template_filename))
+        await asyncio.gather(*writes)
+        if template_filename:
+            await asyncio.to_thread(capture.print_summary)
     
+    async def _get_content_cached(self, page: Page) -> str:
+        """Return the page's rendered body text, reusing a recent snapshot.
+        
+        The snapshot is dropped when the main frame navigates and after
+        _CONTENT_CACHE_TTL seconds.
+        
+        Args:
+            page: Playwright page object
+            
+        Returns:
+            document.body.innerText
+        """
+        cached = self._content_cache.get(page)
+        if cached and time.monotonic() - cached[0] < _CONTENT_CACHE_TTL:
+            return cached[1]
+        if page not in self._content_pages:
+            page.on('framenavigated', lambda frame: (
+                self._content_cache.pop(page, None)
+                if frame == page.main_frame else None))
+            self._content_pages.add(page)
+        content = await page.evaluate(_BODY_TEXT_JS)
+        self._content_cache[page] = (time.monotonic(), content)
+        return content
+    
+    def _ensure_dialog_handler(self, page: Page):
+        """Register the dialog listener on page, once for its lifetime."""
+        if page not in self._dialog_pages:
+            page.on('dialog', self._accept_dialog)
+            self._dialog_pages.add(page)
+    
+    async def _wait_stable(self, page: Page, anchor_selector: Optional[str] = None,
+                           timeout: int = 15000):
+        """Wait until the next page is usable.
+        
+        Waits for DOMContentLoaded and then for an element unique to the
+        expected page, instead of networkidle plus a fixed sleep. A missing
+        anchor is not an error: callers still check URL/title afterwards.
+        
+        Args:
+            page: Playwright page object
+            anchor_selector: Selector that appears once the next page has rendered
+            timeout: Maximum time to wait in milliseconds
+        """
+        await page.wait_for_load_state('domcontentloaded', timeout=timeout)
+        if anchor_selector:
+            try:
+                await page.wait_for_selector(anchor_selector, state='attached',
+                                             timeout=timeout)
+            except PlaywrightTimeoutError:
+                logger.debug("Anchor not found within %sms: %s", timeout, anchor_selector)
+    
+    async def _click_and_wait(self, page: Page, button: Locator,
+                              anchor_selector: Optional[str] = None,
+                              timeout: int = 30000):
+        """Click a button that submits the page and wait for the new page.
+        
+        The click is wrapped in page.expect_navigation so the wait is tied to
+        the navigation it triggers and returns on that page's load event.
+        A click that does not navigate only logs; errors from the click
+        itself are raised.
+        
+        Args:
+            page: Playwright page object
+            button: Element to click
+            anchor_selector: Selector to wait for once the new page has loaded
+            timeout: Maximum time to wait for the navigation in milliseconds
+        """
+        clicked = False
+        try:
+            async with page.expect_navigation(wait_until='load', timeout=timeout):
+                await button.click()
+                clicked = True
+        except PlaywrightTimeoutError:
+            if not clicked:
+                raise
+            logger.debug("No navigation within %sms after click", timeout)
+        await self._wait_stable(page, anchor_selector, timeout=timeout)
+    
+    async def _is_page(self, page: Page, url_tokens: Tuple[str, ...],
+                       title_token: str) -> bool:
+        """Check whether page is the step identified by URL or title.
+        
+        page.url is a local property; page.title() is only awaited when the
+        URL does not already match.
+        
+        Args:
+            page: Playwright page object
+            url_tokens: Substrings identifying the step's action URL
+            title_token: Substring of the step's page title
+            
+        Returns:
+            True if the URL or title matches
+        """
+        current_url = page.url
+        if any(t in current_url for t in url_tokens):
+            return True
+        return title_token in await page.title()
+    
+    async def _find_button(
+            self, page: Page, selectors: List[str],
+            predicate: Callable[[Dict], bool],
+            fallback_selector: Optional[str] = None
+    ) -> Optional[Tuple[Locator, Dict]]:
+        """Find the first candidate button accepted by predicate.
+        
+        onclick, text and disabled state for every selector are read in a
+        single page.evaluate call. The chosen candidate is returned as a
+        Locator on the probe's mark, so it targets the element that was
+        checked rather than the selector's first match in the DOM.
+        
+        Args:
+            page: Playwright page object
+            selectors: Candidate selectors, in priority order
+            predicate: Receives {probe, selector, onclick, text, disabled}
+            fallback_selector: Candidate (from selectors) to use when none
+                is accepted; its info is marked with 'fallback': True
+            
+        Returns:
+            (locator, probe info) or None if nothing matched
+        """
+        candidates = await page.evaluate(_PROBE_SELECTORS_JS, list(selectors))
+        for info in candidates:
+            if predicate(info):
+                return self._probed_locator(page, info), info
+        if fallback_selector:
+            for info in candidates:
+                if info['selector'] == fallback_selector:
+                    info['fallback'] = True
+                    return self._probed_locator(page, info), info
+        return None
+
+    @staticmethod
+    def _probed_locator(page: Page, info: Dict) -> Locator:
+        """Locator for the element _PROBE_SELECTORS_JS reported as info."""
+        return page.locator(f'[{_PROBE_TARGET_ATTR}="{info["probe"]}"]')
+
+    async def _find_and_click(
+            self, page: Page, selectors: List[str], label: str,
+            onclick_tokens: Tuple[str, ...] = (),
+            text_tokens: Tuple[str, ...] = (),
+            anchor_selector: Optional[str] = None
+    ) -> bool:
+        """Click the first enabled button matching onclick or text tokens.
+
+        With no tokens, any enabled candidate is accepted.
+
+        Args:
+            page: Playwright page object
+            selectors: Candidate selectors, in priority order
+            label: Button label used in log messages
+            onclick_tokens: Substrings accepted in the onclick attribute
+            text_tokens: Substrings accepted in the button text
+            anchor_selector: Passed to _wait_stable after the click
+
+        Returns:
+            True if the button was clicked, False otherwise
+        """
+        def predicate(b: Dict) -> bool:
+            if b['disabled']:
+                return False
+            if not onclick_tokens and not text_tokens:
+                return True
+            return (any(t in b['onclick'] for t in onclick_tokens)
+                    or any(t in b['text'] for t in text_tokens))
+
+        found = await self._find_button(page, selectors, predicate)
+        if not found:
+            return False
+
+        button, button_info = found
+        selector = button_info['selector']
+        try:
+            await self._click_and_wait(page, button, anchor_selector)
+            logger.info("Clicked '%s' button using selector: %s", label, selector)
+            return True
+        except Exception as e:
+            logger.debug("Failed to click '%s' with selector %s: %s", label, selector, e)
+            return False
+
     async def click_reservation_button_if_slots_found(
             self, page: Page, slots_clicked_flag: int,
             slots: List[Dict]) -> bool:
@@ -48,74 +502,48 @@ class BookingHandler:
         try:
             if slots_clicked_flag != 1:
                 logger.info(
-                    f"Slots clicked flag is {slots_clicked_flag} - no slots were clicked, skipping '予約' button click"
+                    "Slots clicked flag is %s - no slots were clicked, skipping '予約' button click", slots_clicked_flag
                 )
                 return False
 
             logger.info(
-                f"Slots clicked flag is 1 - clicking '予約' button to proceed to reservation page (found {len(slots)} slot(s))..."
+                "Slots clicked flag is 1 - clicking '予約' button to proceed to reservation page (found %s slot(s))...", len(slots)
             )
-            reserve_button = None
-            btn_go_selectors = [
-                '#btn-go',  # Primary selector
-                'button#btn-go',
-                'button.btn-go:has-text("予約")'
-            ]
-
-            for selector in btn_go_selectors:
-                try:
-                    button = await page.query_selector(selector)
-                    if button:
-                        onclick = await button.get_attribute('onclick') or ''
-                        button_text = await button.inner_text()
-
-                        if 'gRsvWOpeReservedApplyAction' in onclick or (
-                                '予約' in button_text
-                                and 'gRsvWInstUseruleRsvApplyAction'
-                                not in onclick):
-                            reserve_button = button
-                            logger.info(
-                                f"Found correct '予約' button with onclick: {onclick[:100] if onclick else 'none'}"
-                            )
-                            break
-                except:
-                    continue
 
-            if not reserve_button:
-                reserve_button = await page.query_selector('#btn-go')
-                if reserve_button:
-                    onclick = await reserve_button.get_attribute('onclick'
-                                                                 ) or ''
+            found = await self._find_button(
+                page, _BTN_GO_SELECTORS,
+                lambda b: any(t in b['onclick'] for t in _RESERVE_ONCLICK_TOKENS) or (
+                    '予約' in b['text']
+                    and 'gRsvWInstUseruleRsvApplyAction' not in b['onclick']),
+                fallback_selector='#btn-go')
+            if found:
+                onclick = found[1]['onclick']
+                if found[1].get('fallback'):
                     logger.info(
-                        f"Using #btn-go button with onclick: {onclick[:100] if onclick else 'none'}"
+                        "Using #btn-go button with onclick: %.100s", onclick or 'none'
+                    )
+                else:
+                    logger.info(
+                        "Found correct '予約' button with onclick: %.100s", onclick or 'none'
                     )
 
-            if reserve_button:
-                is_disabled = await reserve_button.get_attribute('disabled')
-                if not is_disabled:
-                    await reserve_button.scroll_into_view_if_needed()
-                    await page.wait_for_timeout(500)
-                    await reserve_button.click()
+            if found:
+                reserve_button, button_info = found
+                if not button_info['disabled']:
+                    await self._click_and_wait(
+                        page, reserve_button, TERMS_OR_CONFIRMATION_ANCHOR)
                     logger.info(
                         "Successfully clicked '予約' button - navigating to reservation page"
                     )
-
-                    await page.wait_for_load_state('networkidle',
-                                                   timeout=30000)
-                    await page.wait_for_timeout(2000)
                     logger.info("Navigation to reservation page completed")
 
                     # Handle Terms of Use page and reservation confirmation
-                    await self._handle_terms_of_use_page(page)
-                    await self._handle_reservation_confirmation_page(page)
-                    await self._handle_reservation_completion_page(page)
+                    await self._run_booking_steps(page)
                     
                     # Stop network capture and save results
                     if self.enable_network_capture and self.network_capture:
-                        self.network_capture.stop_capture()
-                        self.network_capture.save_to_file('booking_requests.json')
-                        self.network_capture.print_summary()
-                        self.network_capture.save_api_template('booking_api_template.py')
+                        self._save_network_capture(
+                            'booking_requests.json', 'booking_api_template.py')
                     
                     return True
                 else:
@@ -128,463 +556,225 @@ class BookingHandler:
                 return False
         except Exception as e:
             logger.warning(
-                f"Error clicking '予約' button or handling Terms of Use page: {e}"
+                "Error clicking '予約' button or handling Terms of Use page: %s", e
             )
-            import traceback
-            logger.warning(traceback.format_exc())
+            if logger.isEnabledFor(logging.DEBUG):
+                import traceback
+                logger.debug(traceback.format_exc())
             
             # Stop network capture even on error
             if self.enable_network_capture and self.network_capture:
-                self.network_capture.stop_capture()
-                self.network_capture.save_to_file('booking_requests_error.json')
+                self._save_network_capture('booking_requests_error.json')
             
             return False
 
-    async def _handle_terms_of_use_page(self, page: Page) -> bool:
-        """Handle Terms of Use agreement page.
+    async def _run_booking_steps(self, page: Page) -> bool:
+        """Walk _BOOKING_STEPS after the '予約' click, stopping at a failed step.
         
         Args:
             page: Playwright page object
             
         Returns:
-            True if handled successfully, False otherwise
+            True if every step was handled or skipped, False otherwise
         """
+        for step in _BOOKING_STEPS:
+            if not await self._run_step(page, step):
+                return False
+        return True
+
+    async def _run_step(self, page: Page, step: Dict) -> bool:
+        """Handle one booking page described by a _BOOKING_STEPS entry.
+        
+        A step whose page is not showing is skipped.
+        
+        Args:
+            page: Playwright page object
+            step: Entry from _BOOKING_STEPS
+            
+        Returns:
+            True if handled or skipped, False otherwise
+        """
+        name, label = step['name'], step['label']
         try:
-            current_url = page.url
-            page_title = await page.title()
-            if 'rsvWOpeReservedApplyAction' in current_url or '利用規約' in page_title:
-                logger.info(
-                    "Detected Terms of Use page - handling agreement..."
-                )
+            if step['anchor']:
+                await self._wait_stable(page, step['anchor'])
+            if not await self._is_page(page, step['url_tokens'], step['title_token']):
+                return True
+
+            logger.info("Detected %s page", name)
+            if step['prepare']:
+                await getattr(self, step['prepare'])(page)
+
+            logger.info("Clicking '%s' button...", label)
+            if step['click']:
+                clicked = await getattr(self, step['click'])(page, step)
+            else:
+                clicked = await self._find_and_click(
+                    page, step['selectors'], label,
+                    onclick_tokens=step['onclick_tokens'],
+                    text_tokens=step['text_tokens'],
+                    anchor_selector=step['next_anchor'])
+
+            if clicked:
+                logger.info("Successfully handled %s page", name)
+                return True
+            logger.warning("Could not find/click '%s' button on %s page", label, name)
+            return not step['required']
+        except Exception as e:
+            logger.error("Error handling %s page: %s", name, e)
+            return False
 
-                # Click "利用規約に同意する"
-                logger.info("Clicking '利用規約に同意する' label...")
-                agreement_clicked = False
-                agreement_selectors = [
-                    'label[for="ruleFg_1"]',
-                    'label.btn.radiobtn[for="ruleFg_1"]',
-                    'label:has-text("利用規約に同意する")',
-                    'input[type="radio"][value="1"][name*="rule"]',
-                    'input[type="radio"][id="ruleFg_1"]'
-                ]
-
-                for selector in agreement_selectors:
-                    try:
-                        element = await page.query_selector(selector)
-                        if element:
-                            tag_name = await element.evaluate(
-                                'el => el.tagName.toLowerCase()')
-                            if tag_name == 'label':
-                                await element.scroll_into_view_if_needed(
-                                )
-                                await page.wait_for_timeout(300)
-                                await element.click()
-                                logger.info(
-                                    f"Clicked agreement label using selector: {selector}"
-                                )
-                            else:
-                                await element.scroll_into_view_if_needed(
-                                )
-                                await page.wait_for_timeout(300)
-                                await element.check()
-                                logger.info(
-                                    f"Checked agreement input using selector: {selector}"
-                                )
-                            await page.wait_for_timeout(500)
-                            agreement_clicked = True
-                            break
-                    except Exception as e:
-                        logger.debug(
-                            f"Failed to click agreement with selector {selector}: {e}"
-                        )
-                        continue
-
-                if not agreement_clicked:
-                    logger.warning(
-                        "Could not find/click agreement option, trying to proceed anyway"
-                    )
+    async def agree_to_terms(self, page: Page) -> bool:
+        """Click/check the '利用規約に同意する' option on the Terms of Use page.
+        
+        Returns:
+            True if the option was clicked or checked
+        """
+        # All agreement selectors are probed in one evaluate instead of one
+        # locator count per selector
+        found = await self._find_button(page, AGREEMENT_SELECTORS, lambda b: True)
+        if not found:
+            logger.warning(
+                "Could not find/click agreement option, trying to proceed anyway"
+            )
+            return False
 
-                # Click "確認" button
-                logger.info("Clicking '確認' button...")
-                confirm_clicked = False
-                confirm_selectors = [
-                    '#btn-go', 'button#btn-go',
-                    'button:has-text("確認")',
-                    'button[type="submit"]:has-text("確認")',
-                    'button[onclick*="gRsvWInstUseruleRsvApplyAction"]'
-                ]
-
-                for selector in confirm_selectors:
-                    try:
-                        confirm_button = await page.query_selector(
-                            selector)
-                        if confirm_button:
-                            is_disabled = await confirm_button.get_attribute(
-                                'disabled')
-                            if not is_disabled:
-                                await confirm_button.scroll_into_view_if_needed(
-                                )
-                                await page.wait_for_timeout(500)
-                                await confirm_button.click()
-                                logger.info(
-                                    f"Clicked '確認' button using selector: {selector}"
-                                )
-
-                                await page.wait_for_load_state(
-                                    'networkidle', timeout=30000)
-                                await page.wait_for_timeout(2000)
-                                confirm_clicked = True
-                                logger.info(
-                                    "Successfully handled Terms of Use page"
-                                )
-                                break
-                    except Exception as e:
-                        logger.debug(
-                            f"Failed to click confirm with selector {selector}: {e}"
-                        )
-                        continue
-
-                if not confirm_clicked:
-                    logger.warning(
-                        "Could not find/click '確認' button on Terms of Use page"
-                    )
-                
-                return confirm_clicked
-            return True
+        element, info = found
+        selector = info['selector']
+        try:
+            # Every agreement selector names its tag up front
+            if selector.startswith('label'):
+                await element.click()
+                logger.info("Clicked agreement label using selector: %s", selector)
+            else:
+                await element.check()
+                logger.info("Checked agreement input using selector: %s", selector)
         except Exception as e:
-            logger.error(f"Error handling Terms of Use page: {e}")
+            logger.warning(
+                "Failed to click agreement with selector %s, trying to proceed anyway: %s",
+                selector, e
+            )
             return False
 
-    async def _handle_reservation_confirmation_page(self, page: Page) -> bool:
-        """Handle reservation confirmation page (fill user count, click final reserve button).
+        # Agreeing enables the 確認 button; wait for that rather than a fixed delay
+        try:
+            await page.wait_for_selector('#btn-go:not([disabled])', timeout=3000)
+        except PlaywrightTimeoutError:
+            pass
+        return True
+
+    async def _fill_user_counts(self, page: Page):
+        """Fill in "利用人数" (Number of Users) for each reservation slot."""
+        # Default number of users: 2 (as requested by user)
+        default_user_count = 2
+        await FormUtils.fill_user_count_inputs(page, default_user_count)
+
+    async def _click_final_reserve(self, page: Page, step: Dict) -> bool:
+        """Click the final '予約' button and accept its confirmation dialog.
         
         Args:
             page: Playwright page object
+            step: The confirmation entry from _BOOKING_STEPS
             
         Returns:
-            True if handled successfully, False otherwise
+            True if the button was clicked, False otherwise
         """
-        try:
-            await page.wait_for_load_state('networkidle',
-                                           timeout=30000)
-            await page.wait_for_timeout(2000)
-            current_url_after_confirm = page.url
-            page_title_after_confirm = await page.title()
-
-            if 'rsvWInstUseruleRsvApplyAction' in current_url_after_confirm or 'rsvWInstRsvApplyAction' in current_url_after_confirm or '予約内容確認' in page_title_after_confirm:
-                logger.info(
-                    "Detected reservation confirmation page - filling in number of users for each reservation slot..."
-                )
+        found = await self._find_button(
+            page, step['selectors'],
+            lambda b: not b['disabled'] and (
+                any(t in b['onclick'] for t in step['onclick_tokens']) or (
+                    '予約' in b['text']
+                    and 'checkTextValue' in b['onclick'])))
+        if not found:
+            return False
 
-                # Fill in "利用人数" (Number of Users) for each reservation slot
-                # Default number of users: 2 (as requested by user)
-                default_user_count = 2
+        final_button, button_info = found
+        selector = button_info['selector']
 
-                # Use FormUtils to fill user count inputs
-                await FormUtils.fill_user_count_inputs(page, default_user_count)
+        self._ensure_dialog_handler(page)
+        self._dialog_handled.clear()
 
-                await page.wait_for_timeout(500)
+        try:
+            # The dialog is accepted by the page listener; the
+            # navigation follows once it has been accepted
+            self.final_submit_clicked.set()
+            await self._click_and_wait(page, final_button, step['next_anchor'])
+            logger.info(
+                "Clicked final '予約' button on reservation confirmation page using selector: %s", selector
+            )
 
-                logger.info(
-                    "Filled user count fields - clicking final '予約' button..."
+            if self._dialog_handled.is_set():
+                logger.info("Dialog was handled successfully")
+            else:
+                logger.warning(
+                    "Dialog handler was set but dialog may not have appeared"
                 )
+            # The wait above ends on whichever outcome rendered first
+            if not await page.locator(COMPLETION_PAGE_ANCHOR).count():
+                logger.warning(
+                    "Final '予約' did not reach the completion page (title: %s)",
+                    await page.title()
+                )
+                return False
+            return True
+        except Exception as click_error:
+            logger.warning(
+                "Error clicking button or handling dialog: %s", click_error
+            )
 
-                final_reserve_clicked = False
-                final_reserve_selectors = [
-                    '#btn-go', 'button#btn-go',
-                    'button:has-text("予約")',
-                    'button[onclick*="gRsvWInstRsvApplyAction"]',
-                    'button[onclick*="checkTextValue"]'
-                ]
-
-                for selector in final_reserve_selectors:
-                    try:
-                        final_button = await page.query_selector(
-                            selector)
-                        if final_button:
-                            button_onclick = await final_button.get_attribute(
-                                'onclick') or ''
-                            button_text = await final_button.inner_text(
-                            )
-
-                            if 'gRsvWInstRsvApplyAction' in button_onclick or (
-                                    '予約' in button_text
-                                    and 'checkTextValue'
-                                    in button_onclick):
-                                is_disabled = await final_button.get_attribute(
-                                    'disabled')
-                                if not is_disabled:
-                                    await final_button.scroll_into_view_if_needed(
-                                    )
-                                    await page.wait_for_timeout(500)
-
-                                    dialog_handled = False
-
-                                    async def handle_dialog(
-                                            dialog):
-                                        nonlocal dialog_handled
-                                        dialog_message = dialog.message
-                                        logger.info(
-                                            f"JavaScript dialog detected: {dialog_message}"
-                                        )
-                                        if "予約申込処理を行います" in dialog_message or "よろしいですか" in dialog_message:
-                                            logger.info(
-                                                "Accepting reservation confirmation dialog..."
-                                            )
-                                            await dialog.accept()
-                                            dialog_handled = True
-                                        else:
-                                            logger.warning(
-                                                f"Unexpected dialog message: {dialog_message}, accepting anyway"
-                                            )
-                                            await dialog.accept()
-                                            dialog_handled = True
-
-                                    page.on(
-                                        'dialog', handle_dialog)
-
-                                    try:
-                                        await final_button.click()
-                                        logger.info(
-                                            f"Clicked final '予約' button on reservation confirmation page using selector: {selector}"
-                                        )
-
-                                        await page.wait_for_timeout(
-                                            1000)
-
-                                        if dialog_handled:
-                                            logger.info(
-                                                "Dialog was handled successfully"
-                                            )
-                                        else:
-                                            logger.warning(
-                                                "Dialog handler was set but dialog may not have appeared"
-                                            )
-
-                                        await page.wait_for_load_state(
-                                            'networkidle',
-                                            timeout=30000)
-                                        await page.wait_for_timeout(
-                                            2000)
-                                        final_reserve_clicked = True
-                                        logger.info(
-                                            "Successfully clicked final '予約' button and handled dialog - booking should be completed"
-                                        )
-                                        break
-                                    except Exception as click_error:
-                                        logger.warning(
-                                            f"Error clicking button or handling dialog: {click_error}"
-                                        )
-                                        try:
-                                            async with page.expect_dialog(
-                                            ) as dialog_info:
-                                                await final_button.click(
-                                                )
-                                            dialog = await dialog_info.value
-                                            logger.info(
-                                                f"Dialog appeared: {dialog.message}"
-                                            )
-                                            await dialog.accept()
-                                            logger.info(
-                                                "Accepted dialog using expect_dialog"
-                                            )
-                                            await page.wait_for_load_state(
-                                                'networkidle',
-                                                timeout=30000)
-                                            await page.wait_for_timeout(
-                                                2000)
-                                            final_reserve_clicked = True
-                                            logger.info(
-                                                "Successfully clicked final '予約' button and handled dialog (alternative method) - booking should be completed"
-                                            )
-                                            break
-                                        except Exception as alt_error:
-                                            logger.warning(
-                                                f"Alternative dialog handling also failed: {alt_error}"
-                                            )
-                                            continue
-                                    finally:
-                                        try:
-                                            page.remove_listener(
-                                                'dialog',
-                                                handle_dialog)
-                                        except:
-                                            pass
-                    except Exception as e:
-                        logger.debug(
-                            f"Failed to click final reserve button with selector {selector}: {e}"
-                        )
-                        continue
-
-                if not final_reserve_clicked:
-                    logger.warning(
-                        "Could not find/click final '予約' button on reservation confirmation page"
-                    )
-                
-                return final_reserve_clicked
+        try:
+            # Retry the click and require the dialog this time
+            self._dialog_handled.clear()
+            await final_button.click()
+            await asyncio.wait_for(self._dialog_handled.wait(), timeout=30)
+            logger.info("Accepted dialog on retried click")
+            await self._wait_stable(page, step['next_anchor'])
             return True
-        except Exception as e:
-            logger.error(f"Error handling reservation confirmation page: {e}")
+        except Exception as alt_error:
+            logger.warning(
+                "Alternative dialog handling also failed: %s", alt_error
+            )
             return False
 
-    async def _handle_reservation_completion_page(self, page: Page) -> bool:
-        """Handle reservation completion page (click payment button, then back button).
+    async def click_and_wait_for_reservation_number(
+            self, page: Page, button: Locator,
+            timeout: int = 120000) -> Optional[str]:
+        """Click the final 予約 button and read the number as the next page renders.
+        
+        The wait is started before the click, so the reservation number is
+        picked up by the same poll that sees the completion page instead of
+        after a separate navigation wait and extraction. The click raises a
+        confirmation dialog, accepted by the same listener as
+        _click_final_reserve uses.
         
         Args:
-            page: Playwright page object
+            page: Playwright page object on the reservation confirmation page
+            button: The final 予約 button
+            timeout: Maximum wait for the next page in milliseconds
             
         Returns:
-            True if handled successfully, False otherwise
+            Reservation number, or None if the next page loaded without a
+            labelled one (use extract_reservation_number as a fallback)
         """
+        # Without a listener Playwright dismisses the confirm() and the
+        # reservation is never submitted
+        self._ensure_dialog_handler(page)
+        self._dialog_handled.clear()
+        await page.evaluate(f"() => {{ window.{_RESERVE_CLICK_MARKER} = true; }}")
+        waiter = asyncio.create_task(page.wait_for_function(
+            _RESERVATION_NUMBER_WAIT_JS, arg=_RESERVE_CLICK_MARKER,
+            timeout=timeout))
         try:
-            # After clicking final '予約' button, check if we're on reservation completion page
-            # and click "未入金予約の確認・支払へ" button if present
-            await page.wait_for_load_state('networkidle',
-                                           timeout=30000)
-            await page.wait_for_timeout(2000)
-            current_url_after_booking = page.url
-            page_title_after_booking = await page.title()
-
-            if 'rsvWInstRsvApplyAction' in current_url_after_booking or '予約完了' in page_title_after_booking:
-                logger.info(
-                    "Detected reservation completion page - clicking '未入金予約の確認・支払へ' button..."
-                )
-
-                payment_button_clicked = False
-                payment_button_selectors = [
-                    '#btn-go',  # Primary selector
-                    'button#btn-go',
-                    'button:has-text("未入金予約の確認・支払へ")',
-                    'button[onclick*="gRsvCreditInitListAction"]',
-                    'button[onclick*="doAction"][onclick*="gRsvCreditInitListAction"]'
-                ]
-
-                for selector in payment_button_selectors:
-                    try:
-                        payment_button = await page.query_selector(
-                            selector)
-                        if payment_button:
-                            # Verify this is the payment button by checking onclick or text
-                            button_onclick = await payment_button.get_attribute(
-                                'onclick') or ''
-                            button_text = await payment_button.inner_text(
-                            )
-
-                            if 'gRsvCreditInitListAction' in button_onclick or '未入金予約の確認・支払へ' in button_text:
-                                is_disabled = await payment_button.get_attribute(
-                                    'disabled')
-                                if not is_disabled:
-                                    await payment_button.scroll_into_view_if_needed(
-                                    )
-                                    await page.wait_for_timeout(500)
-                                    await payment_button.click()
-                                    logger.info(
-                                        f"Clicked '未入金予約の確認・支払へ' button using selector: {selector}"
-                                    )
-
-                                    await page.wait_for_load_state(
-                                        'networkidle',
-                                        timeout=30000)
-                                    await page.wait_for_timeout(2000)
-                                    payment_button_clicked = True
-                                    logger.info(
-                                        "Successfully clicked '未入金予約の確認・支払へ' button - navigated to payment page"
-                                    )
-
-                                    # After clicking payment button, check if we're on the payment page
-                                    # and click "もどる" (Back) button to return to home page
-                                    await page.wait_for_load_state(
-                                        'networkidle',
-                                        timeout=30000)
-                                    await page.wait_for_timeout(2000)
-                                    current_url_after_payment = page.url
-                                    page_title_after_payment = await page.title(
-                                    )
-
-                                    if 'rsvWRsvGetNotPaymentRsvDataListAction' in current_url_after_payment or 'rsvWCreditInitListAction' in current_url_after_payment or '未入金予約の確認・支払' in page_title_after_payment:
-                                        logger.info(
-                                            "Detected payment page - clicking 'もどる' (Back) button to return to home page..."
-                                        )
-
-                                        back_button_clicked = False
-                                        back_button_selectors = [
-                                            'button.btn-back:has-text("もどる")',
-                                            'button:has-text("もどる")',
-                                            'button[onclick*="gRsvWOpeHomeAction"]',
-                                            'button[onclick*="doAction"][onclick*="gRsvWOpeHomeAction"]',
-                                            '.btn-back',
-                                            'button.btn-back'
-                                        ]
-
-                                        for back_selector in back_button_selectors:
-                                            try:
-                                                back_button = await page.query_selector(
-                                                    back_selector)
-                                                if back_button:
-                                                    # Verify this is the back button by checking onclick or text
-                                                    button_onclick = await back_button.get_attribute(
-                                                        'onclick'
-                                                    ) or ''
-                                                    button_text = await back_button.inner_text(
-                                                    )
-
-                                                    if 'gRsvWOpeHomeAction' in button_onclick or 'もどる' in button_text:
-                                                        is_disabled = await back_button.get_attribute(
-                                                            'disabled'
-                                                        )
-                                                        if not is_disabled:
-                                                            await back_button.scroll_into_view_if_needed(
-                                                            )
-                                                            await page.wait_for_timeout(
-                                                                500
-                                                            )
-                                                            await back_button.click(
-                                                            )
-                                                            logger.info(
-                                                                f"Clicked 'もどる' button using selector: {back_selector}"
-                                                            )
-
-                                                            await page.wait_for_load_state(
-                                                                'networkidle',
-                                                                timeout
-                                                                =30000
-                                                            )
-                                                            await page.wait_for_timeout(
-                                                                2000
-                                                            )
-                                                            back_button_clicked = True
-                                                            logger.info(
-                                                                "Successfully clicked 'もどる' button - returned to home page"
-                                                            )
-                                                            break
-                                            except Exception as e:
-                                                logger.debug(
-                                                    f"Failed to click back button with selector {back_selector}: {e}"
-                                                )
-                                                continue
-
-                                        if not back_button_clicked:
-                                            logger.warning(
-                                                "Could not find/click 'もどる' button on payment page"
-                                            )
-
-                                    break
-                    except Exception as e:
-                        logger.debug(
-                            f"Failed to click payment button with selector {selector}: {e}"
-                        )
-                        continue
-
-                if not payment_button_clicked:
-                    logger.warning(
-                        "Could not find/click '未入金予約の確認・支払へ' button on reservation completion page"
-                    )
-                
-                return payment_button_clicked
-            return True
-        except Exception as e:
-            logger.error(f"Error handling reservation completion page: {e}")
-            return False
+            self.final_submit_clicked.set()
+            await button.click()
+            handle = await waiter
+        finally:
+            if not waiter.done():
+                waiter.cancel()
+        if not self._dialog_handled.is_set():
+            logger.warning("Final '予約' completed without a confirmation dialog")
+        result = await handle.json_value()
+        return result.get('number')
 
     async def extract_reservation_number(self, page: Page) -> Optional[str]:
         """Extract reservation number from completion page.
@@ -596,34 +786,36 @@ class BookingHandler:
             Reservation number string or None if not found
         """
         try:
-            # Try multiple selectors for reservation number
-            selectors = [
-                'text=予約番号', 'text=予約番号:', '[class*="reservation"]',
-                'td:has-text("予約番号") + td'
-            ]
-            
-            for selector in selectors:
-                try:
-                    element = await page.query_selector(selector)
-                    if element:
-                        text = await element.text_content()
-                        # Extract number from text
-                        import re
-                        numbers = re.findall(r'\d{10}', text or '')
-                        if numbers:
-                            return numbers[0]
-                except:
+            # The number is normally labelled in the page text; one read of
+            # it answers that without probing any selectors
+            content = await self._get_content_cached(page)
+            match = _RES_NUM_CTX_RE.search(content)
+            if match:
+                return match.group(1)
+
+            # Fallback: the label and number in separate elements. The text
+            # engine and the CSS union each scan the DOM once, concurrently.
+            label_texts, cell_texts = await asyncio.gather(
+                page.get_by_text('予約番号').all_text_contents(),
+                page.locator(_RES_NUM_SELECTOR).all_text_contents(),
+                return_exceptions=True
+            )
+            texts = []
+            for probed in (label_texts, cell_texts):
+                if isinstance(probed, Exception):
+                    logger.debug("Reservation number probe failed: %s", probed)
                     continue
-            
-            # Fallback: extract from page content
-            content = await page.content()
-            import re
-            numbers = re.findall(r'予約番号[：:]\s*(\d{10})', content)
-            if numbers:
-                return numbers[0]
-                
-            return None
+                texts.extend(probed)
+
+            # One pass over all element text
+            first_bare = None
+            for match in _RES_NUM_RE.finditer('\n'.join(texts)):
+                if match.group(1):
+                    return match.group(2)
+                if first_bare is None:
+                    first_bare = match.group(2)
+            return first_bare
         except Exception as e:
-            logger.error(f"Error extracting reservation number: {e}")
+            logger.error("Error extracting reservation number: %s", e)
             return None
 
@@ -3,32 +3,56 @@ import sys
 import asyncio
 import logging
 from typing import Dict, Optional
-from datetime import datetime
+from types import MappingProxyType
 
 # Fix for Windows asyncio subprocess issues
 if sys.platform == 'win32':
     asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
 from app.browser_automation import BrowserAutomation
+from app.config import settings
 from app.database import AsyncSessionLocal, Reservation, AvailabilitySlot, MonitoringLog
-from sqlalchemy import select
+from sqlalchemy import func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 logger = logging.getLogger(__name__)
 
+# Seconds the log writer waits after the first queued row to batch any others
+_LOG_BATCH_WINDOW = 0.05
+
+# Building code -> area code expected by the booking form
+_AREA_MAP = MappingProxyType({
+    '1040': '1200_1040',  # しながわ区民公園
+    '1030': '1500_1030',  # 八潮北公園
+    '1010': '1400_1010',  # しながわ中央公園
+    '1020': '1400_1020',  # 東品川公園
+})
+
 
 class BookingService:
     """Service for handling booking operations."""
     
     def __init__(self):
         self.browser = BrowserAutomation()
+        # MonitoringLog rows are written by a background task, off the
+        # booking path
+        self._log_queue: asyncio.Queue = asyncio.Queue()
+        self._log_writer: Optional[asyncio.Task] = None
     
-    async def initialize(self):
-        """Initialize browser."""
+    async def initialize(self) -> Dict[str, str]:
+        """Start the browser and log in.
+        
+        Does not touch the database, so callers can run it alongside
+        init_db() and other startup work.
+        
+        Returns:
+            Cookies from the login, as a name -> value dict
+        """
         await self.browser.start()
         # Login and get cookies
         cookies = await self.browser.login()
         logger.info("Booking service initialized")
+        return cookies
     
     async def book_available_slot(
         self,
@@ -49,10 +73,8 @@ class BookingService:
             Reservation details
         """
         try:
-            # Get slot from database
-            stmt = select(AvailabilitySlot).where(AvailabilitySlot.id == slot_id)
-            result = await session.execute(stmt)
-            slot = result.scalar_one_or_none()
+            # Get slot from database (identity map first, then a PK SELECT)
+            slot = await session.get(AvailabilitySlot, slot_id)
             
             if not slot:
                 raise ValueError(f"Slot {slot_id} not found")
@@ -71,30 +93,51 @@ class BookingService:
             }
             
             # Attempt booking via browser
-            booking_result = await self.browser.book_slot(slot_data)
+            booking_result = await self._book_with_deadline(slot_data)
             
             if booking_result['success']:
-                # Check if a reservation with status='selected' already exists for this slot
-                stmt = select(Reservation).where(
-                    Reservation.use_ymd == slot.use_ymd,
-                    Reservation.bcd == slot.bcd,
-                    Reservation.icd == slot.icd,
-                    Reservation.start_time == slot.start_time,
-                    Reservation.end_time == slot.end_time,
-                    Reservation.status == 'selected'
+                # Confirm one reservation already 'selected' for this slot,
+                # if any. The UPDATE targets that row's primary key and
+                # re-checks its status, so it is claimed by at most one
+                # booking and no other selection is touched.
+                selected_id = await session.scalar(
+                    select(Reservation.id)
+                    .where(
+                        Reservation.use_ymd == slot.use_ymd,
+                        Reservation.bcd == slot.bcd,
+                        Reservation.icd == slot.icd,
+                        Reservation.start_time == slot.start_time,
+                        Reservation.end_time == slot.end_time,
+                        Reservation.status == 'selected'
+                    )
+                    .order_by(Reservation.id)
+                    .limit(1)
                 )
-                result = await session.execute(stmt)
-                existing_reservation = result.scalar_one_or_none()
+                reservation = None
+                if selected_id is not None:
+                    stmt = (
+                        update(Reservation)
+                        .where(
+                            Reservation.id == selected_id,
+                            Reservation.status == 'selected'
+                        )
+                        .values(
+                            reservation_number=booking_result['reservation_number'],
+                            user_count=user_count,
+                            event_name=event_name,
+                            status='confirmed',
+                            booking_data=booking_result,
+                            updated_at=func.now()
+                        )
+                        .returning(Reservation)
+                    )
+                    result = await session.execute(stmt)
+                    claimed = result.scalars().all()
+                    # Zero rows: another booking confirmed it first
+                    if len(claimed) == 1:
+                        reservation = claimed[0]
                 
-                if existing_reservation:
-                    # Update existing reservation with booking details
-                    existing_reservation.reservation_number = booking_result['reservation_number']
-                    existing_reservation.user_count = user_count
-                    existing_reservation.event_name = event_name
-                    existing_reservation.status = 'confirmed'
-                    existing_reservation.booking_data = booking_result
-                    existing_reservation.updated_at = datetime.utcnow()
-                    reservation = existing_reservation
+                if reservation:
                     logger.info(f"Updated existing selected reservation to confirmed: {booking_result['reservation_number']}")
                 else:
                     # Create new reservation record
@@ -114,23 +157,22 @@ class BookingService:
                         status='confirmed',
                         booking_data=booking_result
                     )
-                    session.add(reservation)
                     logger.info(f"Created new reservation record: {booking_result['reservation_number']}")
                 
                 # Update slot status
                 slot.status = 'booked'
-                slot.updated_at = datetime.utcnow()
+                slot.updated_at = func.now()
+                
+                session.add(reservation)
+                await session.commit()
                 
                 # Log booking
-                log = MonitoringLog(
+                self._log(MonitoringLog(
                     log_type='booking',
                     message=f'Successfully booked slot {slot_id}',
                     data={'slot_id': slot_id, 'reservation_number': booking_result['reservation_number']},
                     success=True
-                )
-                session.add(log)
-                
-                await session.commit()
+                ))
                 
                 return {
                     'success': True,
@@ -144,26 +186,73 @@ class BookingService:
             logger.error(f"Booking error: {e}")
             
             # Log error
-            log = MonitoringLog(
+            self._log(MonitoringLog(
                 log_type='booking',
                 message=f'Booking failed for slot {slot_id}: {str(e)}',
                 data={'slot_id': slot_id, 'error': str(e)},
                 success=False
-            )
-            session.add(log)
-            await session.commit()
+            ))
             
             raise
     
-    def _get_area_code(self, bcd: str) -> str:
+    async def _book_with_deadline(self, slot_data: Dict) -> Dict:
+        """Run book_slot, bounded by settings.booking_timeout.
+        
+        The deadline only applies until the final 予約 is clicked. After
+        that the site may already have made the reservation, so the attempt
+        is left to finish instead of being cancelled and recorded as failed.
+        
+        Raises:
+            TimeoutError: If the deadline passed before the final submit
+        """
+        task = asyncio.create_task(self.browser.book_slot(slot_data))
+        try:
+            done, _ = await asyncio.wait({task}, timeout=settings.booking_timeout)
+            if not done and not self.browser.booking_handler.final_submit_clicked.is_set():
+                task.cancel()
+                await asyncio.wait({task})
+                raise TimeoutError(
+                    f"Booking timed out after {settings.booking_timeout}s "
+                    "before the final submit"
+                )
+            return await task
+        finally:
+            # Also cancels the attempt if this coroutine is cancelled
+            if not task.done():
+                task.cancel()
+    
+    def _log(self, log: MonitoringLog):
+        """Queue a MonitoringLog row, starting the writer task if needed."""
+        self._log_queue.put_nowait(log)
+        if self._log_writer is None or self._log_writer.done():
+            self._log_writer = asyncio.create_task(self._write_logs())
+    
+    async def _write_logs(self):
+        """Drain the log queue, committing each batch in its own session."""
+        while True:
+            logs = [await self._log_queue.get()]
+            try:
+                await asyncio.sleep(_LOG_BATCH_WINDOW)
+            finally:
+                # Also runs on cancel, so a batch already taken is not lost
+                while not self._log_queue.empty():
+                    logs.append(self._log_queue.get_nowait())
+                await self._commit_logs(logs)
+    
+    @staticmethod
+    async def _commit_logs(logs: list):
+        """Insert a batch of MonitoringLog rows."""
+        try:
+            async with AsyncSessionLocal() as session:
+                session.add_all(logs)
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Error writing {len(logs)} monitoring log(s): {e}")
+    
+    @staticmethod
+    def _get_area_code(bcd: str) -> str:
         """Get area code from building code."""
-        area_map = {
-            '1040': '1200_1040',  # しながわ区民公園
-            '1030': '1500_1030',  # 八潮北公園
-            '1010': '1400_1010',  # しながわ中央公園
-            '1020': '1400_1020',  # 東品川公園
-        }
-        return area_map.get(bcd, '1400_0')
+        return _AREA_MAP.get(bcd, '1400_0')
     
     async def get_reservations(
         self,
@@ -180,6 +269,17 @@ class BookingService:
         return list(result.scalars().all())
     
     async def cleanup(self):
-        """Cleanup browser resources."""
+        """Flush queued logs and cleanup browser resources."""
+        if self._log_writer:
+            self._log_writer.cancel()
+            try:
+                await self._log_writer
+            except asyncio.CancelledError:
+                pass
+        pending = []
+        while not self._log_queue.empty():
+            pending.append(self._log_queue.get_nowait())
+        if pending:
+            await self._commit_logs(pending)
         await self.browser.stop()
 
@@ -1,24 +1,184 @@
 """Browser automation for booking operations - Componentized version."""
 import sys
 import asyncio
+import re
 
 if sys.platform == "win32":
     asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
-from playwright.async_api import Browser, BrowserContext, Page
+from playwright.async_api import (
+    Browser, BrowserContext, Locator, Page,
+    TimeoutError as PlaywrightTimeoutError
+)
 from typing import Dict, Optional, List
 import logging
+from pathlib import Path
 
 from app.browser_session import BrowserSession
 from app.login_handler import LoginHandler
 from app.search_handler import SearchHandler
 from app.slot_extractor import SlotExtractor
-from app.booking_handler import BookingHandler
+from app.booking_handler import (
+    AGREEMENT_SELECTORS, FINAL_RESERVE_OUTCOME_ANCHOR, SELECTOR_MATCHES_JS,
+    TERMS_OR_CONFIRMATION_ANCHOR, BookingHandler)
+from app.calendar_navigator import CalendarNavigator
+from app.cell_selection_verifier import CellSelectionVerifier
+from app.form_utils import FormUtils
+from app.results_checker import ResultsChecker
 from app.config import settings
 from app.status_tracker import status_tracker, LoginStatus
 
 logger = logging.getLogger(__name__)
 
+# Search results have rendered once either result container is shown
+_RESULTS_READY_SELECTOR = '#unreserved-list:visible, #unreserved-notfound:visible'
+_RESERVE_BUTTONS_SELECTOR = 'button:has-text("予約"), a:has-text("予約")'
+_VISIBLE_RESERVE_BUTTONS_SELECTOR = (
+    'button:visible:has-text("予約"), a:visible:has-text("予約")'
+)
+
+# Date view is usable once the park dropdown FormUtils.select_park() looks
+# for, the facility dropdown or a result row is present
+_DATE_VIEW_READY_SELECTOR = (
+    'select[name*="bcd"], select#bname, select[name*="area"], '
+    '#iname, #facility-select, tr[id^="20"]'
+)
+
+# Terms page is ready once its agreement control (or, if the site skipped
+# it, the confirmation page's inputs) is shown
+_TERMS_PAGE_READY_SELECTORS = (TERMS_OR_CONFIRMATION_ANCHOR, *AGREEMENT_SELECTORS)
+
+# [確認] button on the terms page, in order of preference
+_TERMS_CONFIRM_SELECTORS = (
+    'button:has-text("確認")',
+    'input[type="submit"][value*="確認"]',
+    'button[type="submit"]:has-text("確認")',
+    '#btn-confirm, #btn-go',
+)
+
+# User-count input on the reservation confirmation page
+_USER_COUNT_SELECTOR = 'input[name*="人数"], input[name*="applyNum"]'
+
+# Resolves with the first of args.selectors that matches (optionally only
+# displayed elements), or null after args.timeout ms. A MutationObserver
+# re-tests on every DOM change instead of polling. 'css:has-text("x")' is
+# supported through booking_handler's SELECTOR_MATCHES_JS.
+_WAIT_FOR_ANY_SELECTOR_JS = r"""(args) => new Promise((resolve) => {
+    """ + SELECTOR_MATCHES_JS + r"""
+    const shown = (el) => {
+        if (!args.visible) return true;
+        const style = window.getComputedStyle(el);
+        return style.visibility !== 'hidden' && el.getClientRects().length > 0;
+    };
+    const match = () => {
+        for (const selector of args.selectors) {
+            try {
+                for (const el of selectorMatches(selector)) {
+                    if (shown(el)) return selector;
+                }
+            } catch (e) {
+                continue;
+            }
+        }
+        return null;
+    };
+    const found = match();
+    if (found) return resolve(found);
+    const observer = new MutationObserver(() => {
+        const hit = match();
+        if (hit) {
+            observer.disconnect();
+            clearTimeout(timer);
+            resolve(hit);
+        }
+    });
+    observer.observe(document, {subtree: true, childList: true, attributes: true});
+    const timer = setTimeout(() => {
+        observer.disconnect();
+        resolve(null);
+    }, args.timeout);
+})"""
+
+# Delays (seconds) before re-checking an inconclusive "not logged in" result
+_LOGIN_RECHECK_DELAYS = (0.25, 0.5)
+
+# Attribute used to mark the [予約] button chosen by _FIND_RESERVATION_BUTTON_JS
+_RESERVATION_TARGET_ATTR = 'data-booking-target'
+
+# Finds the slot's row among tr[id^="20"] (strategy 1: row ID prefix,
+# strategy 2: the datePattern and timePattern regexes both match the row ID
+# or text), takes the first
+# 'button:has-text("予約"), td.reservation button, button.btn-go' in it and
+# marks it with _RESERVATION_TARGET_ATTR if it is displayed.
+_FIND_RESERVATION_BUTTON_JS = """(args) => {
+    const attr = '""" + _RESERVATION_TARGET_ATTR + """';
+    document.querySelectorAll('[' + attr + ']').forEach(el => el.removeAttribute(attr));
+    const rows = Array.from(document.querySelectorAll('tr[id^="20"]')).filter(r => r.id);
+    const rowButton = (row) => {
+        for (const btn of row.querySelectorAll('button')) {
+            if (btn.matches('td.reservation button, button.btn-go')
+                    || (btn.innerText || '').includes('予約')) {
+                return window.getComputedStyle(btn).display !== 'none' ? btn : null;
+            }
+        }
+        return null;
+    };
+    const strategies = [];
+    if (args.rowIdPattern) {
+        strategies.push([1, row => row.id.startsWith(args.rowIdPattern)]);
+    }
+    const dateRe = new RegExp(args.datePattern);
+    const timeRe = new RegExp(args.timePattern);
+    strategies.push([2, row => {
+        // innerText forces layout, so only read it when the ID alone is not enough
+        if (dateRe.test(row.id) && timeRe.test(row.id)) return true;
+        const haystack = row.id + ' ' + (row.innerText || '');
+        return dateRe.test(haystack) && timeRe.test(haystack);
+    }]);
+    for (const [strategy, matches] of strategies) {
+        for (const row of rows) {
+            if (!matches(row)) continue;
+            const btn = rowButton(row);
+            if (btn) {
+                btn.setAttribute(attr, '1');
+                return {strategy: strategy, rowId: row.id, rows: rows.length};
+            }
+        }
+    }
+    return {strategy: null, rowId: null, rows: rows.length};
+}"""
+
+# Clicks the toggle of every collapsed date section (h3[id^="20"] followed
+# by a .collapse sibling without .show) and returns how many were clicked
+_EXPAND_DATE_SECTIONS_JS = """() => {
+    let clicked = 0;
+    document.querySelectorAll('h3[id^="20"]').forEach(h => {
+        const sib = h.nextElementSibling;
+        if (sib && sib.classList.contains('collapse') && !sib.classList.contains('show')) {
+            const btn = h.querySelector('button, a');
+            if (btn) {
+                btn.click();
+                clicked++;
+            }
+        }
+    });
+    return clicked;
+}"""
+
+# True once no date section is left collapsed
+_DATE_SECTIONS_EXPANDED_JS = """() => Array.from(document.querySelectorAll('h3[id^="20"]'))
+    .map(h => h.nextElementSibling)
+    .every(sib => !sib || !sib.classList.contains('collapse') || sib.classList.contains('show'))"""
+
+# value/text of every option in the facility dropdown (#facility-select on
+# the results page, #iname in the search form), or null if neither exists
+_COURT_OPTIONS_JS = """() => {
+    const select = document.querySelector('#facility-select')
+        || document.querySelector('#iname');
+    if (!select) return null;
+    return Array.from(select.options, o => ({value: o.value, text: o.innerText}));
+}"""
+
 
 class BrowserAutomation:
     """Handles browser automation for booking - Componentized architecture."""
@@ -34,13 +194,17 @@ class BrowserAutomation:
         self.login_handler: Optional[LoginHandler] = None
         self.search_handler: Optional[SearchHandler] = None
         self.slot_extractor = SlotExtractor()
+        self.results_checker = ResultsChecker()
         
         # Use config value if not explicitly provided
         if enable_network_capture is None:
             enable_network_capture = settings.enable_network_capture
         
         self.booking_handler = BookingHandler(enable_network_capture=enable_network_capture)
-        self._main_page_ref = {'main_page': None}  # Use dict to allow reference updates
+        # Park position lookups by area code and bcd, rebuilt if target_parks is replaced
+        self._park_index_source: Optional[list] = None
+        self._area_to_index: Dict[str, int] = {}
+        self._bcd_to_index: Dict[str, int] = {}
     
     # Backward compatibility properties
     @property
@@ -61,8 +225,7 @@ class BrowserAutomation:
     @main_page.setter
     def main_page(self, value):
         """Backward compatibility: set main_page in session."""
-        self.session.main_page = value
-        self._main_page_ref['main_page'] = value
+        self.session.set_main_page(value)
     
     async def start(self):
         """Start browser instance."""
@@ -70,13 +233,13 @@ class BrowserAutomation:
         if self.session.browser and self.session.browser.is_connected():
             logger.debug("Browser already running - skipping start")
             if self.session.context and not self.login_handler:
-                self.login_handler = LoginHandler(self.session.context, self._main_page_ref)
+                self.login_handler = self._new_login_handler()
                 self.search_handler = SearchHandler(main_page=self.session.main_page)
             return
         
         await self.session.start()
         if self.session.context:
-            self.login_handler = LoginHandler(self.session.context, self._main_page_ref)
+            self.login_handler = self._new_login_handler()
             # Initialize search handler with main page reference
             self.search_handler = SearchHandler(main_page=self.session.main_page)
     
@@ -84,6 +247,13 @@ class BrowserAutomation:
         """Stop browser instance."""
         await self.session.stop()
     
+    def _new_login_handler(self) -> LoginHandler:
+        """Create a login handler that logs in on pooled pages."""
+        return LoginHandler(self.session.context,
+                            lambda: self.session.main_page,
+                            self.session.set_main_page,
+                            page_factory=self.session.acquire_page)
+    
     async def login(self) -> Dict[str, str]:
         """Login to the system and return cookies.
         
@@ -94,11 +264,9 @@ class BrowserAutomation:
             await self.start()
         
         if not self.login_handler:
-            self.login_handler = LoginHandler(self.session.context, self._main_page_ref)
+            self.login_handler = self._new_login_handler()
         
         cookies = await self.login_handler.login()
-        # Update session's main_page reference
-        self.session.main_page = self._main_page_ref['main_page']
         # Update search handler with new main page
         if self.session.main_page:
             self.search_handler = SearchHandler(main_page=self.session.main_page)
@@ -117,7 +285,7 @@ class BrowserAutomation:
             if not self.login_handler:
                 if not self.session.context:
                     await self.start()
-                self.login_handler = LoginHandler(self.session.context, self._main_page_ref)
+                self.login_handler = self._new_login_handler()
             
             # Check if we have a main page
             page = self.session.main_page
@@ -127,9 +295,24 @@ class BrowserAutomation:
                 status_tracker.set_login_status(LoginStatus.LOGGED_IN)
                 return True
             
+            # A login confirmed moments ago (e.g. before the previous park)
+            # does not need the page read again
+            if self.login_handler.login_recently_confirmed(page):
+                logger.debug("Login confirmed recently - no action needed")
+                status_tracker.set_login_status(LoginStatus.LOGGED_IN)
+                return True
+            
             # Check if currently logged in WITHOUT modifying the page state
             # This is a read-only check that doesn't navigate or close anything
-            is_logged_in = await self.login_handler.is_logged_in(page)
+            is_logged_in, certain = await self.login_handler.check_login_state(page)
+            
+            # An inconclusive negative (e.g. the page was read mid-navigation)
+            # is re-checked with a short backoff before closing the page
+            for delay in _LOGIN_RECHECK_DELAYS:
+                if is_logged_in or certain:
+                    break
+                await asyncio.sleep(delay)
+                is_logged_in, certain = await self.login_handler.check_login_state(page)
             
             if is_logged_in:
                 logger.debug("User is still logged in - no action needed")
@@ -137,34 +320,15 @@ class BrowserAutomation:
                 status_tracker.set_login_status(LoginStatus.LOGGED_IN)
                 return True
             
-            # Double-check: Sometimes the login check can be incorrect immediately after login
-            # Wait a moment and check again before closing the page
-            import asyncio
-            await asyncio.sleep(1)
-            is_logged_in_retry = await self.login_handler.is_logged_in(page)
-            
-            if is_logged_in_retry:
-                logger.debug("User is logged in (verified on retry) - no action needed")
-                status_tracker.set_login_status(LoginStatus.LOGGED_IN)
-                return True
-            
             # Only re-login if we're actually logged out (session expired)
             # Do NOT log out - the user is already logged out
             logger.warning("Session expired or user already logged out - re-logging in...")
             status_tracker.add_activity_log("login", "Session expired - re-logging in...", {}, "warning")
             status_tracker.set_login_status(LoginStatus.NOT_LOGGED_IN)
             
-            # Close the old page only if it exists and is not already closed
-            # This is necessary because we need a fresh page for login
-            try:
-                if page and not page.is_closed():
-                    logger.debug("Closing old page before re-login")
-                    await page.close()
-            except Exception as e:
-                logger.debug(f"Error closing old page: {e}")
-            
-            # Re-login (creates new page)
-            await self.login()
+            # Close the expired page while logging in on a fresh (pooled) page;
+            # the old page's session is already gone, so the two can overlap
+            await asyncio.gather(self._close_page_quietly(page), self.login())
             status_tracker.set_login_status(LoginStatus.LOGGED_IN)
             status_tracker.add_activity_log("login", "Successfully re-logged in after session expiration")
             logger.info("Successfully re-logged in after session expiration")
@@ -173,8 +337,20 @@ class BrowserAutomation:
         except Exception as e:
             logger.error(f"Error checking/renewing login: {e}")
             status_tracker.add_error(f"Login check/renewal failed: {str(e)}")
+            # A failed check or re-login must not be answered from the cache
+            if self.login_handler:
+                self.login_handler.forget_login_confirmation()
             return False
     
+    async def _close_page_quietly(self, page: Optional[Page]):
+        """Close page if it is still open, logging (not raising) errors."""
+        try:
+            if page and not page.is_closed():
+                logger.debug("Closing old page before re-login")
+                await page.close()
+        except Exception as e:
+            logger.debug(f"Error closing old page: {e}")
+    
     async def get_available_courts_for_park(self, page: Page, area_code: str) -> List[Dict]:
         """Get list of available tennis courts (facilities) for a park from the dropdown.
         
@@ -187,22 +363,14 @@ class BrowserAutomation:
         """
         courts = []
         try:
-            # Wait for facility dropdown to be available
-            # The dropdown might be #iname (in search form) or #facility-select (in results view)
-            facility_dropdown = None
-
-            # Try #facility-select first (results page)
-            facility_dropdown = await page.query_selector('#facility-select')
-            if not facility_dropdown:
-                # Try #iname (search form)
-                facility_dropdown = await page.query_selector('#iname')
-
-            if facility_dropdown:
-                # Get all option elements
-                options = await facility_dropdown.query_selector_all('option')
+            # The dropdown might be #iname (in search form) or #facility-select
+            # (in results view); all options are read in one evaluate
+            options = await page.evaluate(_COURT_OPTIONS_JS)
+
+            if options is not None:
                 for option in options:
-                    value = await option.get_attribute('value')
-                    text = await option.inner_text()
+                    value = option['value']
+                    text = option['text']
 
                     # Skip "指定なし" (Not specified) option (value="0")
                     if value and value != '0' and '庭球場' in text:
@@ -256,9 +424,8 @@ class BrowserAutomation:
             page = self.session.main_page
             logger.info("Reusing main page to maintain session")
         else:
-            page = await self.session.create_page()
-            self.session.main_page = page
-            self._main_page_ref['main_page'] = page
+            page = await self.session.acquire_page()
+            self.session.set_main_page(page)
             logger.info("Created new page for search")
         
         # Initialize search handler if not already initialized
@@ -319,6 +486,91 @@ class BrowserAutomation:
             self.session.main_page, next_area_code, next_park_name
         )
     
+    async def _wait_for_selector_quietly(
+            self, page: Page, selector: str, timeout: int = 10000):
+        """Wait for selector, returning (not raising) if it does not appear.
+        
+        Replaces fixed sleeps where the caller re-checks the page itself.
+        """
+        try:
+            await page.wait_for_selector(selector, timeout=timeout)
+        except PlaywrightTimeoutError:
+            logger.debug(f"{selector} not found within {timeout}ms")
+    
+    async def _wait_for_any_selector(
+            self, page: Page, selectors, timeout: int = 10000,
+            visible: bool = True) -> Optional[str]:
+        """Wait in the page for the first of selectors to match.
+        
+        One page.evaluate backed by a MutationObserver, so the match is seen
+        on the DOM change that produces it and all selectors are tested in
+        the same round trip.
+        
+        Args:
+            page: Playwright page object
+            selectors: CSS selectors, optionally ending in :has-text("...")
+            timeout: Maximum wait in milliseconds
+            visible: Only match displayed elements
+            
+        Returns:
+            The matching selector, or None on timeout or navigation
+        """
+        try:
+            return await page.evaluate(_WAIT_FOR_ANY_SELECTOR_JS, {
+                'selectors': list(selectors),
+                'timeout': timeout,
+                'visible': visible,
+            })
+        except Exception as e:
+            logger.debug(f"Selector wait interrupted: {e}")
+            return None
+    
+    async def _find_reservation_button(
+            self, page: Page, use_ymd: str, time_str: str,
+            bcd: str, icd: str) -> Optional[Locator]:
+        """Find the visible [予約] button in the results row for a slot.
+        
+        Strategy 1 matches the row ID prefix (only when bcd and icd are
+        known); strategy 2 matches the date and time in the row ID or text.
+        Both run in one page.evaluate, which marks the chosen button so it
+        can be returned as a locator.
+        
+        Args:
+            page: Playwright page object
+            use_ymd: Date as YYYYMMDD
+            time_str: Start time as HHMM
+            bcd: Building code
+            icd: Facility code
+            
+        Returns:
+            Locator for the button, or None if no row matched
+        """
+        hour, minute = int(time_str[:2]), int(time_str[2:])
+        row_id_pattern = f"{use_ymd}_{bcd}_{icd}_{time_str}_" if bcd and icd else ''
+        if row_id_pattern:
+            logger.info(f"Trying to find row with ID pattern: {row_id_pattern}*")
+
+        date_tokens = (use_ymd, f"{use_ymd[:4]}年", f"{use_ymd[4:6]}月",
+                       f"{use_ymd[6:8]}日")
+        time_tokens = (time_str, f"{hour}時{minute}分",
+                       f"{hour:02d}時{minute:02d}分")
+        match = await page.evaluate(_FIND_RESERVATION_BUTTON_JS, {
+            'rowIdPattern': row_id_pattern,
+            'datePattern': '|'.join(map(re.escape, date_tokens)),
+            'timePattern': '|'.join(map(re.escape, time_tokens)),
+        })
+        logger.info(f"Checked {match['rows']} rows with date IDs")
+        if not match['rowId']:
+            return None
+
+        if match['strategy'] == 1:
+            logger.info(f"Found [予約] button in row {match['rowId']}")
+        else:
+            logger.info(
+                f"Found [予約] button by matching date/time in row {match['rowId']}"
+            )
+        return page.locator(f'[{_RESERVATION_TARGET_ATTR}]')
+    
     async def book_slot(
             self,
             slot_data: Dict,
@@ -334,20 +586,17 @@ class BrowserAutomation:
         """
         if not self.session.context:
             await self.start()
+        self.booking_handler.final_submit_clicked.clear()
         
         # Use main page if available (maintains session), otherwise create new page
         if self.session.main_page and not self.session.main_page.is_closed():
             page = self.session.main_page
             logger.info("Reusing main page for booking to maintain session")
         else:
-            page = await self.session.create_page()
-            logger.info("Created new page for booking")
+            page = await self.session.acquire_page()
+            logger.info("Using pooled page for booking")
         
         try:
-            from app.form_utils import FormUtils
-            from app.results_checker import ResultsChecker
-            from app.config import settings
-            
             # CRITICAL: First fill the search form on the current page (home page)
             # Do NOT navigate away - this will destroy the session
             current_url = page.url
@@ -379,10 +628,14 @@ class BrowserAutomation:
                     logger.warning(
                         "Not on date view page - navigating (this might affect session)"
                     )
+                    # Continue once the response commits and the search form
+                    # (or the result rows) is in the DOM, not on network idle
                     await page.goto(date_view_url,
-                                    wait_until='networkidle',
-                                    timeout=120000)
-                    await page.wait_for_load_state('networkidle', timeout=120000)
+                                    wait_until='commit',
+                                    timeout=30000)
+                    await page.wait_for_selector(_DATE_VIEW_READY_SELECTOR,
+                                                 state='attached',
+                                                 timeout=30000)
             
                     # Fill form on date view page if needed
                     area_code = slot_data.get('area_code', '1400_0')
@@ -398,10 +651,9 @@ class BrowserAutomation:
 
             # Check if results are displayed
             logger.info("Checking if search was successful...")
-            await page.wait_for_timeout(2000)  # Wait for results to render
+            await self._wait_for_selector_quietly(page, _RESULTS_READY_SELECTOR)
 
-            results_checker = ResultsChecker()
-            has_results, has_reservation_buttons = await results_checker.check_results_available(page)
+            has_results, has_reservation_buttons = await self.results_checker.check_results_available(page)
 
             # Handle no results case
             if not has_results and not has_reservation_buttons:
@@ -413,11 +665,8 @@ class BrowserAutomation:
                     current_bcd = slot_data.get('bcd', '')
 
                     # Find current park index and get next park
-                    current_park_index = -1
-                    for i, park in enumerate(settings.target_parks):
-                        if park['area'] == current_area_code or park['bcd'] == current_bcd:
-                            current_park_index = i
-                            break
+                    current_park_index = self._find_park_index(
+                        current_area_code, current_bcd)
 
                     # Try next park if available
                     if current_park_index >= 0 and current_park_index < len(settings.target_parks) - 1:
@@ -432,10 +681,11 @@ class BrowserAutomation:
                                 next_park_name=next_park['name'])
 
                             # Wait for results to load
-                            await page.wait_for_timeout(2000)
+                            await self._wait_for_selector_quietly(
+                                page, _RESULTS_READY_SELECTOR)
 
                             # Check for results again
-                            has_results, has_reservation_buttons = await results_checker.check_results_available(page)
+                            has_results, has_reservation_buttons = await self.results_checker.check_results_available(page)
 
                             if not has_results and not has_reservation_buttons:
                                 logger.warning(
@@ -481,20 +731,21 @@ class BrowserAutomation:
                     self.search_handler = SearchHandler(main_page=page)
                 await self.search_handler._click_load_more_button(page)
 
-            # Look for [予約] buttons in the results
-            reservation_buttons = await page.query_selector_all(
-                'button:has-text("予約"), a:has-text("予約")')
+            # Look for [予約] buttons in the results; the locator is reused
+            # for the retry and for strategy 3 below
+            reservation_buttons = page.locator(_RESERVE_BUTTONS_SELECTOR)
+            button_count = await reservation_buttons.count()
 
             # If no reservation buttons found, wait and try again
-            if not reservation_buttons or len(reservation_buttons) == 0:
+            if button_count == 0:
                 logger.warning(
                     "No [予約] buttons found despite success message - may need to wait longer or check page state"
                 )
-                await page.wait_for_timeout(3000)
-                reservation_buttons = await page.query_selector_all(
-                    'button:has-text("予約"), a:has-text("予約")')
+                await self._wait_for_selector_quietly(
+                    page, _RESERVE_BUTTONS_SELECTOR, timeout=5000)
+                button_count = await reservation_buttons.count()
 
-                if not reservation_buttons or len(reservation_buttons) == 0:
+                if button_count == 0:
                     raise Exception(
                         "No [予約] buttons found on page - cannot proceed with booking"
                     )
@@ -509,140 +760,43 @@ class BrowserAutomation:
                 f"Looking for [予約] button for date {use_ymd}, time {time_str}, bcd {bcd}, icd {icd}..."
             )
 
-            reservation_button = None
-
-            # Strategy 1: Try to find button by row ID pattern
+            # Strategy 1 matches rows by ID: expand all date sections first
             if bcd and icd:
                 try:
-                    row_id_pattern = f"{use_ymd}_{bcd}_{icd}_{time_str}_"
-                    logger.info(
-                        f"Trying to find row with ID pattern: {row_id_pattern}*"
-                    )
-
-                    # Expand all date sections
-                    try:
-                        date_headers = await page.query_selector_all(
-                            'h3[id^="20"] button, h3[id^="20"] a')
-                        for header in date_headers:
-                            try:
-                                parent = await header.evaluate_handle(
-                                    'el => el.closest("h3")')
-                                if parent:
-                                    next_sibling = await parent.evaluate_handle(
-                                        'el => el.nextElementSibling')
-                                    if next_sibling:
-                                        classes = await next_sibling.get_attribute('class') or ''
-                                        if 'collapse' in classes and 'show' not in classes:
-                                            await header.click()
-                                            await page.wait_for_timeout(500)
-                            except:
-                                continue
-                    except Exception as e:
-                        logger.warning(f"Error expanding date sections: {e}")
-
-                    # Find all rows that match the pattern
-                    all_rows = await page.query_selector_all('tr[id^="20"]')
-                    logger.info(f"Found {len(all_rows)} rows with date IDs")
-
-                    for row in all_rows:
-                        row_id = await row.get_attribute('id')
-                        if not row_id:
-                            continue
-
-                        if row_id.startswith(row_id_pattern):
-                            button = await row.query_selector(
-                                'button:has-text("予約"), td.reservation button, button.btn-go'
-                            )
-                            if button:
-                                is_visible = await button.evaluate(
-                                    'el => window.getComputedStyle(el).display !== "none"'
-                                )
-                                if is_visible:
-                                    reservation_button = button
-                                    logger.info(
-                                        f"Found [予約] button in row {row_id}")
-                                    break
+                    expanded = await page.evaluate(_EXPAND_DATE_SECTIONS_JS)
+                    if expanded:
+                        logger.debug(f"Expanding {expanded} collapsed date sections")
+                        await page.wait_for_function(_DATE_SECTIONS_EXPANDED_JS,
+                                                     timeout=5000)
                 except Exception as e:
-                    logger.warning(f"Error finding button by row ID: {e}")
-
-            # Strategy 2: Find button by matching date and time in the same row
-            if not reservation_button:
-                try:
-                    logger.info(
-                        "Trying to find button by matching date and time in table rows..."
-                    )
-                    all_rows = await page.query_selector_all('tr[id^="20"]')
-                    logger.info(
-                        f"Checking {len(all_rows)} rows for date/time match..."
-                    )
+                    logger.warning(f"Error expanding date sections: {e}")
 
-                    for row in all_rows:
-                        try:
-                            row_id = await row.get_attribute('id')
-                            if not row_id:
-                                continue
-
-                            row_text = await row.inner_text()
-
-                            # Check if row contains date pattern
-                            date_match = (
-                                str(use_ymd) in row_id
-                                or f"{use_ymd[:4]}年" in row_text
-                                or f"{use_ymd[4:6]}月" in row_text
-                                or f"{use_ymd[6:8]}日" in row_text
-                                or str(use_ymd) in row_text)
-
-                            # Check if row contains the time
-                            time_hour = int(time_str[:2])
-                            time_min = int(time_str[2:])
-                            time_match = (
-                                time_str in row_id
-                                or f"{time_hour}時{time_min}分" in row_text
-                                or f"{time_hour:02d}時{time_min:02d}分" in row_text
-                                or time_str in row_text)
-
-                            if date_match and time_match:
-                                logger.info(
-                                    f"Found matching row by date/time: {row_id}"
-                                )
-                                button = await row.query_selector(
-                                    'button:has-text("予約"), td.reservation button, button.btn-go'
-                                )
-                                if button:
-                                    is_visible = await button.evaluate(
-                                        'el => window.getComputedStyle(el).display !== "none"'
-                                    )
-                                    if is_visible:
-                                        reservation_button = button
-                                        logger.info(
-                                            f"Found [予約] button by matching date/time in row {row_id}"
-                                        )
-                                        break
-                        except Exception as e:
-                            logger.warning(f"Error checking row: {e}")
-                            continue
-                except Exception as e:
-                    logger.warning(f"Error finding button by date/time match: {e}")
+            # Strategies 1 and 2 (row ID pattern, then date/time text in the
+            # row) are matched in the browser in one evaluate
+            reservation_button = None
+            try:
+                reservation_button = await self._find_reservation_button(
+                    page, use_ymd, time_str, bcd, icd)
+            except Exception as e:
+                logger.warning(f"Error finding button by row ID or date/time match: {e}")
 
             # Strategy 3: Click first available [予約] button if we can't find specific one
-            if not reservation_button and reservation_buttons:
+            if not reservation_button:
                 logger.info(
-                    f"Could not find specific slot, trying first available [予約] button from {len(reservation_buttons)} buttons..."
+                    f"Could not find specific slot, trying first available [予約] button from {button_count} buttons..."
                 )
-                for btn in reservation_buttons:
-                    try:
-                        is_visible = await btn.evaluate(
-                            'el => window.getComputedStyle(el).display !== "none"'
-                        )
-                        if is_visible:
-                            reservation_button = btn
-                            logger.info("Using first visible [予約] button")
-                            break
-                    except:
-                        continue
+                # Playwright's :visible is checked by the selector engine,
+                # so no per-button visibility evaluate is needed
+                visible_buttons = page.locator(_VISIBLE_RESERVE_BUTTONS_SELECTOR)
+                try:
+                    if await visible_buttons.count():
+                        reservation_button = visible_buttons.first
+                        logger.info("Using first visible [予約] button")
+                except Exception as e:
+                    logger.debug(f"Error checking [予約] button visibility: {e}")
 
                 if not reservation_button:
-                    reservation_button = reservation_buttons[0]
+                    reservation_button = reservation_buttons.first
                     logger.info(
                         "Using first [予約] button (visibility check failed)")
 
@@ -654,118 +808,77 @@ class BrowserAutomation:
             # Click [予約] button - this will navigate to terms agreement page
             logger.info("Clicking [予約] button...")
             try:
-                await reservation_button.scroll_into_view_if_needed()
-                await page.wait_for_timeout(500)
-
-                button_text = await reservation_button.inner_text()
-                button_onclick = await reservation_button.get_attribute('onclick')
-                logger.info(
-                    f"Button text: {button_text}, onclick: {button_onclick[:100] if button_onclick else 'None'}"
-                )
+                # Diagnostics only: skip the round trip when INFO is off
+                if logger.isEnabledFor(logging.INFO):
+                    button_text, button_onclick = await reservation_button.evaluate(
+                        'el => [el.textContent.trim(), el.getAttribute("onclick")]')
+                    logger.info(
+                        f"Button text: {button_text}, onclick: {button_onclick[:100] if button_onclick else 'None'}"
+                    )
 
-                async with page.expect_navigation(wait_until='networkidle',
-                                                  timeout=120000):
-                    await reservation_button.click()
+                # One navigation wait covers both the normal click and the
+                # JavaScript fallback; it returns as soon as the terms page
+                # response commits and the selector wait below covers the rest
+                async with page.expect_navigation(wait_until='commit',
+                                                  timeout=60000):
+                    try:
+                        await reservation_button.click(timeout=10000)
+                    except Exception as e:
+                        logger.error(f"Error clicking [予約] button: {e}")
+                        logger.info("Trying alternative click method (JavaScript)...")
+                        await reservation_button.evaluate('el => el.click()')
             except Exception as e:
-                logger.error(f"Error clicking [予約] button: {e}")
-                try:
-                    logger.info("Trying alternative click method (JavaScript)...")
-                    await reservation_button.evaluate('el => el.click()')
-                    await page.wait_for_load_state('networkidle',
-                                                   timeout=120000)
-                except Exception as e2:
-                    logger.error(f"Alternative click also failed: {e2}")
-                    raise
-
-            await page.wait_for_load_state('networkidle', timeout=120000)
-            await page.wait_for_timeout(2000)
+                logger.error(f"Could not open terms page from [予約] button: {e}")
+                raise
 
             # Handle Terms of Use page
             logger.info("Handling terms agreement page...")
             try:
-                await page.wait_for_selector('text=利用規約, text=利用規約に同意',
-                                             timeout=30000)
+                if not await self._wait_for_any_selector(
+                        page, _TERMS_PAGE_READY_SELECTORS, timeout=30000):
+                    raise Exception("Terms agreement page did not load")
 
-                # Click "利用規約に同意する"
+                # Click "利用規約に同意する"; a miss is logged and the
+                # booking proceeds anyway
                 logger.info("Clicking agreement option...")
-                agreement_selectors = [
-                    'input[value*="同意する"]', 'input[type="radio"][value="1"]',
-                    'label:has-text("利用規約に同意する")',
-                    'input[name*="agree"], input[name*="rule"]'
-                ]
-                agreement_clicked = False
-                for selector in agreement_selectors:
-                    try:
-                        element = await page.query_selector(selector)
-                        if element:
-                            tag_name = await element.evaluate(
-                                'el => el.tagName.toLowerCase()')
-                            if tag_name == 'label':
-                                await page.click(selector)
-                            else:
-                                await page.check(selector)
-                            await page.wait_for_timeout(500)
-                            agreement_clicked = True
-                            logger.info(
-                                f"Selected agreement using selector: {selector}"
-                            )
-                            break
-                    except:
-                        continue
-
-                if not agreement_clicked:
-                    logger.warning(
-                        "Could not find agreement option, trying to proceed anyway"
-                    )
+                await self.booking_handler.agree_to_terms(page)
 
                 # Click [確認] (Confirm) button
                 logger.info("Clicking [確認] button...")
-                confirm_selectors = [
-                    'button:has-text("確認")',
-                    'input[type="submit"][value*="確認"]',
-                    'button[type="submit"]:has-text("確認")',
-                    '#btn-confirm, #btn-go'
-                ]
-                confirm_clicked = False
-                for selector in confirm_selectors:
-                    try:
-                        await page.wait_for_selector(selector,
-                                                     state='visible',
-                                                     timeout=5000)
-                        async with page.expect_navigation(
-                                wait_until='networkidle', timeout=120000):
-                            await page.click(selector)
-                        confirm_clicked = True
-                        logger.info(f"Clicked [確認] using selector: {selector}")
-                        break
-                    except:
-                        continue
-
-                if not confirm_clicked:
+                # All candidates are waited for together, then the first
+                # displayed match is clicked
+                confirm_selector = await self._wait_for_any_selector(
+                    page, _TERMS_CONFIRM_SELECTORS, timeout=20000)
+                if not confirm_selector:
                     raise Exception("Could not find [確認] button")
-
-                await page.wait_for_load_state('networkidle', timeout=120000)
-                await page.wait_for_timeout(2000)
+                async with page.expect_navigation(
+                        wait_until='domcontentloaded', timeout=120000):
+                    await page.locator(confirm_selector).locator(
+                        'visible=true').first.click()
+                logger.info(f"Clicked [確認] using selector: {confirm_selector}")
 
             except Exception as e:
                 logger.error(f"Error handling terms agreement page: {e}")
                 raise
 
             # After clicking [確認] on terms page, we should be on confirmation/booking form
-            # Fill confirmation form
-            user_count_selector = 'input[name*="人数"], input[name*="applyNum"]'
-            await page.wait_for_selector(user_count_selector,
-                                         state='visible',
-                                         timeout=60000)
-            await page.fill(user_count_selector, '2')
+            # Fill confirmation form; waiting for its user-count input is
+            # what confirms the confirmation page has loaded
+            user_count_input = await page.wait_for_selector(_USER_COUNT_SELECTOR,
+                                                            state='visible',
+                                                            timeout=60000)
+            await user_count_input.fill('2')
             
-            # Click final booking button and wait for navigation
-            async with page.expect_navigation(wait_until='networkidle',
-                                              timeout=120000):
-                await page.click('button:has-text("予約")')
+            # Click final booking button; the reservation number is read as
+            # soon as the completion page renders it
+            reservation_number = await self.booking_handler.click_and_wait_for_reservation_number(
+                page, page.locator('button:has-text("予約")').first)
             
-            # Extract reservation number
-            reservation_number = await self.booking_handler.extract_reservation_number(page)
+            # Fallback: number not labelled in the page text
+            if not reservation_number:
+                await self._wait_for_selector_quietly(
+                    page, FINAL_RESERVE_OUTCOME_ANCHOR, timeout=30000)
+                reservation_number = await self.booking_handler.extract_reservation_number(page)
             
             if reservation_number:
                 return {
@@ -779,31 +892,63 @@ class BrowserAutomation:
         except Exception as e:
             logger.error(f"Booking error: {e}")
             # Take screenshot for debugging
-            try:
-                await page.screenshot(
-                    path=f"error_{slot_data.get('use_ymd', 'unknown')}.png")
-            except:
-                pass
+            if settings.booking_error_screenshots:
+                await self._save_error_screenshot(
+                    page, f"error_{slot_data.get('use_ymd', 'unknown')}.jpg")
             raise
         finally:
             # Don't close the page if it's the main page - keep it alive to maintain session
             # Only close if it's a temporary page created just for booking
             if self.session.main_page != page:
-                try:
-                    await page.close()
-                except:
-                    pass
-                logger.info("Closed temporary booking page")
+                await self.session.release_page(page)
+                logger.info("Returned temporary booking page to pool")
             else:
                 logger.info("Keeping main page alive after booking")
     
+    async def _save_error_screenshot(self, page: Page, path: str):
+        """Save a reduced-quality viewport screenshot, never raising.
+        
+        JPEG of the viewport only keeps the capture and its transfer small;
+        the file is written off the event loop.
+        """
+        try:
+            data = await page.screenshot(type='jpeg', quality=60,
+                                         full_page=False, timeout=5000)
+            await asyncio.to_thread(Path(path).write_bytes, data)
+        except Exception as e:
+            logger.debug(f"Could not save error screenshot {path}: {e}")
+    
+    def _find_park_index(self, area_code: str, bcd: str) -> int:
+        """Return the position of the park matching area_code or bcd in target_parks.
+
+        Args:
+            area_code: Area code of the park (e.g. '1400_1010')
+            bcd: Park BCD code
+
+        Returns:
+            Index of the first park matching either code, or -1 if none does
+        """
+        parks = settings.target_parks
+        if parks is not self._park_index_source:
+            self._area_to_index = {}
+            self._bcd_to_index = {}
+            for i, park in enumerate(parks):
+                self._area_to_index.setdefault(park['area'], i)
+                self._bcd_to_index.setdefault(park['bcd'], i)
+            self._park_index_source = parks
+        matches = [
+            index for index in (self._area_to_index.get(area_code),
+                                self._bcd_to_index.get(bcd))
+            if index is not None
+        ]
+        return min(matches, default=-1)
+
     # Internal methods for backward compatibility (delegated to components)
     async def _is_on_week_one(self, page: Page) -> bool:
         """Check if calendar is currently on week 1.
         
         Delegated to CalendarNavigator for backward compatibility.
         """
-        from app.calendar_navigator import CalendarNavigator
         return await CalendarNavigator.is_on_week_one(page)
     
     async def _navigate_back_to_week_one(self, page: Page) -> bool:
@@ -811,7 +956,6 @@ class BrowserAutomation:
         
         Delegated to CalendarNavigator for backward compatibility.
         """
-        from app.calendar_navigator import CalendarNavigator
         return await CalendarNavigator.navigate_back_to_week_one(page)
     
     async def _extract_slots_from_weekly_calendar(
@@ -861,6 +1005,5 @@ class BrowserAutomation:
         
         Delegated to CellSelectionVerifier for backward compatibility.
         """
-        from app.cell_selection_verifier import CellSelectionVerifier
-        verifier = CellSelectionVerifier()
-        return await verifier.verify_cell_selection(page, cell, cell_id, method_name)
+        return await CellSelectionVerifier.verify_cell_selection(
+            page, cell, cell_id, method_name)
@@ -24,7 +24,6 @@ class BrowserAutomation:
     def __init__(self):
         self.session = BrowserSession()
         self.login_handler: Optional[LoginHandler] = None
-        self._main_page_ref = {'main_page': None}  # Use dict to allow reference updates
     
     @property
     def browser(self):
@@ -50,24 +49,27 @@ class BrowserAutomation:
         """Start browser instance."""
         await self.session.start()
         if self.session.context:
-            self.login_handler = LoginHandler(self.session.context, self._main_page_ref)
+            self.login_handler = self._new_login_handler()
     
     async def stop(self):
         """Stop browser instance."""
         await self.session.stop()
     
+    def _new_login_handler(self) -> LoginHandler:
+        """Create a login handler that stores the logged-in page on the session."""
+        return LoginHandler(self.session.context,
+                            lambda: self.session.main_page,
+                            self.session.set_main_page)
+    
     async def login(self) -> Dict[str, str]:
         """Login to the system and return cookies."""
         if not self.session.context:
             await self.start()
         
         if not self.login_handler:
-            self.login_handler = LoginHandler(self.session.context, self._main_page_ref)
+            self.login_handler = self._new_login_handler()
         
-        cookies = await self.login_handler.login()
-        # Update session's main_page reference
-        self.session.main_page = self._main_page_ref['main_page']
-        return cookies
+        return await self.login_handler.login()
     
     async def get_available_courts_for_park(self, page: Page, area_code: str) -> List[Dict]:
         """Get list of available tennis courts for a park from the dropdown."""
@@ -4,12 +4,129 @@ import asyncio
 from playwright.async_api import async_playwright, Browser, BrowserContext, Page
 from typing import Optional
 import logging
+import weakref
 
 if sys.platform == "win32":
     asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
 logger = logging.getLogger(__name__)
 
+# Number of blank pages kept ready in the context for temporary work
+PAGE_POOL_SIZE = 2
+# Uses after which a pooled page is closed instead of recycled, so
+# renderer memory held by long-lived pages is returned
+PAGE_MAX_USES = 50
+
+
+class PagePool:
+    """Small pool of prewarmed pages belonging to one browser context.
+
+    Pages share the context's cookies, so a recycled page is as good as a
+    freshly created one for the booking flow while skipping the cost of
+    ``new_page()`` on the hot path. Pages that are handed out and never
+    come back (kept as the main page) or are retired are replaced in the
+    background.
+    """
+
+    def __init__(self, context: BrowserContext, size: int = PAGE_POOL_SIZE,
+                 max_uses: int = PAGE_MAX_USES):
+        self.context = context
+        self.max_uses = max_uses
+        self._pages: asyncio.Queue = asyncio.Queue(maxsize=size)
+        # Times each page has been handed back; weak so pages that end up
+        # as the main page and are closed elsewhere are not kept alive
+        self._uses: "weakref.WeakKeyDictionary[Page, int]" = weakref.WeakKeyDictionary()
+        self._refill_task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    async def warm(self):
+        """Pre-create pages until the pool is full."""
+        while not self._closed and not self._pages.full():
+            page = await self.context.new_page()
+            try:
+                self._pages.put_nowait(page)
+            except asyncio.QueueFull:
+                # Filled by a release() while the page was being created
+                await page.close()
+
+    def _schedule_refill(self):
+        """Top the pool back up in the background, once at a time."""
+        if self._closed:
+            return
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.create_task(self._refill())
+
+    async def _refill(self):
+        """Background warm(), logging (not raising) errors."""
+        try:
+            await self.warm()
+        except Exception as e:
+            logger.debug(f"Could not refill page pool: {e}")
+
+    async def acquire(self) -> Page:
+        """Return an open pooled page, creating one if the pool is empty."""
+        page = None
+        while not self._pages.empty():
+            candidate = self._pages.get_nowait()
+            if not candidate.is_closed():
+                page = candidate
+                break
+        if page is None:
+            page = await self.context.new_page()
+            # Ran dry: pages were kept or retired faster than refilled
+            self._schedule_refill()
+        return page
+
+    def detach(self, page: Page):
+        """Mark a handed-out page as kept for good; it is replaced in the background."""
+        self._uses.pop(page, None)
+        self._schedule_refill()
+
+    async def release(self, page: Page):
+        """Return a page to the pool, closing it if the pool is already full.
+
+        Recycled pages are reset to ``about:blank`` so the next caller starts
+        from the same state as a new page. Cookies are left alone since they
+        carry the login shared by the whole context. A page that has served
+        max_uses callers is closed and replaced by a fresh one later.
+        """
+        uses = self._uses.pop(page, 0) + 1
+        if page.is_closed():
+            self._schedule_refill()
+            return
+        if uses < self.max_uses and not self._pages.full():
+            try:
+                await page.goto('about:blank')
+                self._pages.put_nowait(page)
+                self._uses[page] = uses
+                return
+            except Exception as e:
+                logger.debug(f"Could not recycle page, closing it: {e}")
+        try:
+            await page.close()
+        except Exception as e:
+            logger.debug(f"Error closing surplus pooled page: {e}")
+        # No-op when the page was surplus; replaces it when it was retired
+        self._schedule_refill()
+
+    async def close(self):
+        """Stop refilling and close every idle page held by the pool."""
+        self._closed = True
+        if self._refill_task and not self._refill_task.done():
+            self._refill_task.cancel()
+            try:
+                await self._refill_task
+            except BaseException:
+                pass
+        while not self._pages.empty():
+            page = self._pages.get_nowait()
+            try:
+                if not page.is_closed():
+                    await page.close()
+            except Exception as e:
+                logger.debug(f"Error closing pooled page: {e}")
+        self._uses.clear()
+
 
 class BrowserSession:
     """Manages browser instance and session lifecycle."""
@@ -19,6 +136,7 @@ class BrowserSession:
         self.context: Optional[BrowserContext] = None
         self.playwright = None
         self.main_page: Optional[Page] = None
+        self.pool: Optional[PagePool] = None
     
     async def start(self):
         """Start browser instance with realistic settings."""
@@ -73,6 +191,8 @@ class BrowserSession:
             'Sec-Fetch-User': '?1',
             'Cache-Control': 'max-age=0'
         })
+        self.pool = PagePool(self.context)
+        await self.pool.warm()
         logger.info("Browser started in headful mode")
     
     async def stop(self):
@@ -84,6 +204,9 @@ class BrowserSession:
                 self.main_page = None
             except:
                 pass
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
         if self.context:
             await self.context.close()
         if self.browser:
@@ -105,8 +228,34 @@ class BrowserSession:
         if not self.context:
             await self.start()
         return await self.context.new_page()
+
+    async def acquire_page(self) -> Page:
+        """Take a prewarmed page from the pool, starting the browser if needed."""
+        if not self.pool:
+            await self.start()
+        return await self.pool.acquire()
+
+    async def release_page(self, page: Page):
+        """Hand a page from acquire_page back, never raising.
+        
+        After stop() there is no pool, so the page is just closed. Errors
+        are logged rather than raised so they cannot mask the caller's own.
+        """
+        try:
+            if self.pool:
+                await self.pool.release(page)
+            elif not page.is_closed():
+                await page.close()
+        except Exception as e:
+            logger.debug(f"Error releasing page: {e}")
     
     def set_main_page(self, page: Page):
-        """Set the main page to maintain session."""
+        """Set the main page to maintain session.
+        
+        A pooled page kept this way never comes back, so the pool is told
+        to replace it.
+        """
         self.main_page = page
+        if self.pool and page:
+            self.pool.detach(page)
 
@@ -117,8 +117,6 @@ class CalendarNavigator:
                 
                 try:
                     logger.info(f"Clicking '前週' button (click {click_num + 1} of up to {max_backward_clicks})...")
-                    await prev_week_button.scroll_into_view_if_needed()
-                    await page.wait_for_timeout(500)
                     await prev_week_button.click()
                     
                     # Wait for AJAX
@@ -182,8 +180,6 @@ class CalendarNavigator:
                             'el => window.getComputedStyle(el).display !== "none"'
                         )
                         if is_visible:
-                            await button.scroll_into_view_if_needed()
-                            await page.wait_for_timeout(500)
                             await button.click()
                             
                             # Wait for AJAX
@@ -236,8 +232,6 @@ class CalendarNavigator:
                             'el => window.getComputedStyle(el).display !== "none"'
                         )
                         if is_visible:
-                            await button.scroll_into_view_if_needed()
-                            await page.wait_for_timeout(500)
                             await button.click()
                             
                             # Wait for AJAX
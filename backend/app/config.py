@@ -16,10 +16,15 @@ class Settings(BaseSettings):
     # API Settings
     base_url: str = "https://www.cm9.eprs.jp/shinagawa/web"
     api_timeout: int = 30
+    api_cache_ttl: int = 60  # Seconds to reuse an identical availability response
+    api_page_prefetch: int = 4  # Result pages fetched concurrently per park
+    api_max_connections: int = 16  # Pooled connections / in-flight API requests
     
     # Browser Settings
     headless: bool = False  # Headful mode required for JS-heavy pages and browser checks
     browser_timeout: int = 120000  # Increased to 120 seconds for slow JS execution
+    booking_timeout: int = 600  # Seconds one book_slot attempt may take in total
+    booking_error_screenshots: bool = True  # Save a viewport JPEG when a booking fails
     
     # Monitoring Settings
     poll_interval: int = 30
@@ -5,14 +5,23 @@ from sqlalchemy import Column, Integer, String, DateTime, Boolean, JSON, Text, t
 from datetime import datetime
 from app.config import settings
 import logging
+import orjson
 
 logger = logging.getLogger(__name__)
 
+
+def _json_dumps(obj) -> str:
+    """Serialize JSON columns (booking_data, log data) compactly in one pass."""
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
 # Create async engine
 engine = create_async_engine(
     settings.database_url.replace("sqlite://", "sqlite+aiosqlite://"),
     echo=False,
-    future=True
+    future=True,
+    json_serializer=_json_dumps,
+    json_deserializer=orjson.loads
 )
 
 AsyncSessionLocal = async_sessionmaker(
@@ -1,10 +1,23 @@
 """Form filling utilities."""
-from playwright.async_api import Page
+import asyncio
+from playwright.async_api import (
+    Error as PlaywrightError, Page, TimeoutError as PlaywrightTimeoutError
+)
 from typing import List
 import logging
 
 logger = logging.getLogger(__name__)
 
+# True once the '1か月' date radio is checked
+_THIS_MONTH_CHECKED_JS = """() => {
+    const radio = document.querySelector('input#thismonth')
+        || document.querySelector('input[name="date"][value="4"]');
+    return !radio || radio.checked;
+}"""
+
+# Search results have rendered once either result container is shown
+_SEARCH_RESULTS_SELECTOR = '#unreserved-list:visible, #unreserved-notfound:visible'
+
 
 class FormUtils:
     """Utilities for filling forms."""
@@ -21,7 +34,19 @@ class FormUtils:
         Returns:
             Number of input fields filled
         """
+        # (element, id, name) per distinct input, keyed by "id_name"
         user_count_inputs = []
+        seen_keys = set()
+        
+        async def add_input(inp) -> None:
+            # id and name are independent reads - fetch them concurrently
+            inp_id, inp_name = await asyncio.gather(
+                inp.get_attribute('id'), inp.get_attribute('name'))
+            inp_id, inp_name = inp_id or '', inp_name or ''
+            inp_key = f"{inp_id}_{inp_name}"
+            if inp_key not in seen_keys:
+                seen_keys.add(inp_key)
+                user_count_inputs.append((inp, inp_id, inp_name))
         
         # Strategy 1: Direct selectors
         direct_selectors = [
@@ -36,21 +61,7 @@ class FormUtils:
                 inputs = await page.query_selector_all(selector)
                 if inputs:
                     for inp in inputs:
-                        inp_id = await inp.get_attribute('id') or ''
-                        inp_name = await inp.get_attribute('name') or ''
-                        inp_key = f"{inp_id}_{inp_name}"
-                        
-                        # Check for duplicates
-                        already_added = False
-                        for existing in user_count_inputs:
-                            existing_id = await existing.get_attribute('id') or ''
-                            existing_name = await existing.get_attribute('name') or ''
-                            if f"{existing_id}_{existing_name}" == inp_key:
-                                already_added = True
-                                break
-                        
-                        if not already_added:
-                            user_count_inputs.append(inp)
+                        await add_input(inp)
                     
                     if user_count_inputs:
                         logger.info(f"Found {len(user_count_inputs)} '利用人数' input field(s) using direct selector: {selector}")
@@ -74,20 +85,7 @@ class FormUtils:
                                 f'input#{label_for}, input[name="{label_for}"]'
                             )
                             if associated_input:
-                                inp_id = await associated_input.get_attribute('id') or ''
-                                inp_name = await associated_input.get_attribute('name') or ''
-                                inp_key = f"{inp_id}_{inp_name}"
-                                
-                                already_added = False
-                                for existing in user_count_inputs:
-                                    existing_id = await existing.get_attribute('id') or ''
-                                    existing_name = await existing.get_attribute('name') or ''
-                                    if f"{existing_id}_{existing_name}" == inp_key:
-                                        already_added = True
-                                        break
-                                
-                                if not already_added:
-                                    user_count_inputs.append(associated_input)
+                                await add_input(associated_input)
                                 continue
                     except Exception as e:
                         logger.debug(f"Error processing label element: {e}")
@@ -99,31 +97,25 @@ class FormUtils:
         filled_count = 0
         if user_count_inputs:
             logger.info(f"Found {len(user_count_inputs)} '利用人数' input field(s) - filling with {default_user_count} users each...")
-            for idx, user_input in enumerate(user_count_inputs, 1):
+            for idx, (user_input, inp_id, inp_name) in enumerate(user_count_inputs, 1):
                 try:
-                    inp_id = await user_input.get_attribute('id') or ''
-                    inp_name = await user_input.get_attribute('name') or ''
-                    
                     if inp_id:
                         selector = f'input#{inp_id}'
                     elif inp_name:
                         selector = f'input[name="{inp_name}"]'
                     else:
                         await user_input.fill(str(default_user_count))
-                        await page.wait_for_timeout(200)
                         logger.info(f"Filled '利用人数' field {idx} with {default_user_count} users (direct fill)")
                         filled_count += 1
                         continue
                     
                     await page.fill(selector, str(default_user_count))
-                    await page.wait_for_timeout(200)
                     logger.info(f"Filled '利用人数' field {idx} (id={inp_id}, name={inp_name}) with {default_user_count} users")
                     filled_count += 1
                 except Exception as e:
                     logger.warning(f"Failed to fill user count input {idx}: {e}")
                     try:
                         await user_input.fill(str(default_user_count))
-                        await page.wait_for_timeout(200)
                         logger.info(f"Filled '利用人数' field {idx} with {default_user_count} users (fallback direct fill)")
                         filled_count += 1
                     except Exception as e2:
@@ -133,6 +125,14 @@ class FormUtils:
         
         return filled_count
     
+    @staticmethod
+    async def _wait_for_this_month_checked(page: Page):
+        """Wait until the '1か月' radio reports checked, instead of sleeping."""
+        try:
+            await page.wait_for_function(_THIS_MONTH_CHECKED_JS, timeout=2000)
+        except PlaywrightTimeoutError:
+            logger.debug("'1 month' radio not reported checked within 2s")
+    
     @staticmethod
     async def select_date_option(page: Page, option: str = "1か月"):
         """Select date option (1か月, etc.)."""
@@ -143,7 +143,7 @@ class FormUtils:
                 state='visible',
                 timeout=30000)
             await page.click('label.btn.radiobtn[for="thismonth"]')
-            await page.wait_for_timeout(1000)
+            await FormUtils._wait_for_this_month_checked(page)
             logger.info("Selected '1 month' date option via label")
         except Exception as e:
             logger.warning(f"Could not select '1 month' label: {e}, trying alternatives...")
@@ -158,11 +158,11 @@ class FormUtils:
                 try:
                     await page.wait_for_selector(selector, state='visible', timeout=5000)
                     await page.click(selector)
-                    await page.wait_for_timeout(1000)
+                    await FormUtils._wait_for_this_month_checked(page)
                     logger.info(f"Selected '1 month' using alternative selector: {selector}")
                     selected = True
                     break
-                except:
+                except PlaywrightError:
                     continue
             if not selected:
                 logger.error("Failed to select date option with all selectors")
@@ -187,7 +187,7 @@ class FormUtils:
                     dropdown_found = True
                     logger.info(f"Selected park using selector: {selector}")
                     break
-            except:
+            except PlaywrightError:
                 continue
         
         if not dropdown_found:
@@ -212,7 +212,7 @@ class FormUtils:
                     dropdown_found = True
                     logger.info(f"Selected Tennis using selector: {selector}")
                     break
-            except:
+            except PlaywrightError:
                 continue
         
         if not dropdown_found:
@@ -241,12 +241,15 @@ class FormUtils:
                     button_found = True
                     logger.info(f"Clicked search button using selector: {selector}")
                     break
-                except:
+                except PlaywrightError:
                     continue
             
             if not button_found:
                 raise Exception("Could not find search button")
             
             await page.wait_for_load_state('networkidle', timeout=120000)
-            await page.wait_for_timeout(2000)
+            try:
+                await page.wait_for_selector(_SEARCH_RESULTS_SELECTOR, timeout=10000)
+            except PlaywrightTimeoutError:
+                logger.debug("Search results not shown yet - caller re-checks the page")
 
@@ -1,25 +1,39 @@
 """Login handler for authentication."""
 from playwright.async_api import Page, BrowserContext
-from typing import Dict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
 import logging
+import time
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Seconds a confirmed login on a page is trusted without re-reading the page
+LOGIN_CHECK_TTL = 30.0
+
 
 class LoginHandler:
     """Handles user login to the booking system."""
     
-    def __init__(self, context: BrowserContext, main_page_ref):
+    def __init__(self, context: BrowserContext,
+                 get_main_page: Callable[[], Optional[Page]],
+                 set_main_page: Callable[[Page], None],
+                 page_factory: Optional[Callable[[], Awaitable[Page]]] = None):
         """
         Initialize login handler.
         
         Args:
             context: Browser context for creating pages
-            main_page_ref: Reference to main_page that will be set after login
+            get_main_page: Returns the current main page (or None)
+            set_main_page: Stores the logged-in page as the main page
+            page_factory: Coroutine function returning the page to log in on
+                          (e.g. a pooled page); defaults to context.new_page
         """
         self.context = context
-        self.main_page_ref = main_page_ref
+        self.get_main_page = get_main_page
+        self.set_main_page = set_main_page
+        self.page_factory = page_factory or context.new_page
+        # (page, monotonic time) of the last confirmed logged-in check
+        self._confirmed = None
     
     async def login(self) -> Dict[str, str]:
         """
@@ -28,7 +42,7 @@ class LoginHandler:
         Returns:
             Dictionary of cookies
         """
-        page = await self.context.new_page()
+        page = await self.page_factory()
         
         try:
             # Navigate to home page first to initialize session
@@ -59,7 +73,8 @@ class LoginHandler:
             cookies = await self._verify_login_success(page)
             
             # Set main page to maintain session
-            self.main_page_ref['main_page'] = page
+            self.set_main_page(page)
+            self._confirmed = (page, time.monotonic())
             logger.info(f"Keeping page alive at current URL: {page.url} - DO NOT navigate to avoid session destruction")
             
             return cookies
@@ -70,7 +85,7 @@ class LoginHandler:
                 await page.screenshot(path='login_error.png')
             except:
                 pass
-            if self.main_page_ref.get('main_page') != page:
+            if self.get_main_page() != page:
                 await page.close()
             raise
     
@@ -173,11 +188,47 @@ class LoginHandler:
         Returns:
             True if logged in, False otherwise
         """
+        logged_in, _ = await self.check_login_state(page)
+        return logged_in
+    
+    def login_recently_confirmed(self, page: Page) -> bool:
+        """Return True if page was confirmed logged in within LOGIN_CHECK_TTL.
+        
+        Any check that finds the user logged out clears the confirmation.
+        """
+        if not self._confirmed or self._confirmed[0] is not page:
+            return False
+        return time.monotonic() - self._confirmed[1] < LOGIN_CHECK_TTL
+    
+    def forget_login_confirmation(self):
+        """Drop the cached confirmation so the next check reads the page."""
+        self._confirmed = None
+    
+    async def check_login_state(self, page: Page) -> Tuple[bool, bool]:
+        """Check login state and how conclusive the page was about it.
+        
+        Same read-only check as is_logged_in. A negative result is certain
+        only when the page shows a logged-out signal (session timeout or
+        session error page, login form or login URL); otherwise it may be a
+        page read mid-navigation and is worth re-checking.
+        
+        Args:
+            page: Playwright page object to check
+            
+        Returns:
+            (logged_in, certain)
+        """
+        logged_in, certain = await self._read_login_state(page)
+        self._confirmed = (page, time.monotonic()) if logged_in else None
+        return logged_in, certain
+    
+    async def _read_login_state(self, page: Page) -> Tuple[bool, bool]:
+        """Read (logged_in, certain) from the page; see check_login_state."""
         try:
             # Check if page is valid and not closed
             if page.is_closed():
                 logger.warning("Page is closed - cannot check login status")
-                return False
+                return False, True
             
             # Read current page state WITHOUT modifying it
             current_url = page.url
@@ -187,14 +238,14 @@ class LoginHandler:
             # Check for session timeout or error pages (user is already logged out)
             if 'セッションタイムアウト' in page_content or 'Session timeout' in page_content:
                 logger.warning("Session timeout detected - user is logged out")
-                return False
+                return False, True
             
             # Check for explicit error pages
             if 'エラー' in title or 'error' in title.lower():
                 # But check if it's a session error vs other error
                 if 'セッション' in page_content or 'Session' in page_content:
                     logger.warning(f"Session error page detected: {title}")
-                    return False
+                    return False, True
                 # Other errors might not mean logged out - check further
             
             # Check for login indicators (positive signs of being logged in)
@@ -247,12 +298,12 @@ class LoginHandler:
             else:
                 logger.info(f"Login check: NOT logged in (URL: {current_url}, Title: {title}, Has logout: {has_logout}, URL matches: {url_matches})")
             
-            return is_logged_in
+            return is_logged_in, is_logged_in or has_login_form or is_login_page
             
         except Exception as e:
             logger.error(f"Error checking login status: {e}")
             # On error, assume not logged in to be safe (will trigger re-login)
-            return False
+            return False, False
     
     async def _verify_login_success(self, page: Page) -> Dict[str, str]:
         """Verify login was successful and return cookies."""
@@ -19,7 +19,7 @@ import asyncio
 from collections import deque
 
 from app.database import get_db, init_db, AsyncSessionLocal
-from app.api_client import ShinagawaAPIClient
+from app.api_client import ShinagawaAPIClient, get_client
 from app.monitoring_service import MonitoringService
 from app.booking_service import BookingService
 from app.database import AvailabilitySlot, Reservation, MonitoringLog, TakenSlot
@@ -380,27 +380,23 @@ async def startup_event():
     status_tracker.set_backend_status(SystemStatus.RUNNING)
     status_tracker.add_activity_log("system", "Backend starting up...")
     
-    # Initialize database
-    await init_db()
-    status_tracker.add_activity_log("system", "Database initialized")
-    
     # Initialize API client (will be updated with cookies after login)
-    api_client = ShinagawaAPIClient()
+    api_client = get_client()
     
-    # Initialize services
-    status_tracker.set_current_task("Initializing browser automation...")
+    # Initialize database and browser automation (start + login) together;
+    # neither depends on the other
+    status_tracker.set_current_task("Initializing browser automation and logging in...")
     booking_service = BookingService()
-    await booking_service.initialize()
+    _, cookie_dict = await asyncio.gather(init_db(), booking_service.initialize())
+    status_tracker.add_activity_log("system", "Database initialized")
     status_tracker.add_activity_log("system", "Browser automation initialized")
     
     # Initialize monitoring service with browser automation reference
     monitoring_service = MonitoringService(api_client, browser_automation=booking_service.browser)
     
-    # Get cookies from login and update API client
-    status_tracker.set_current_task("Logging in...")
+    # Update API client with the cookies from login
+    status_tracker.set_current_task("Applying login session...")
     try:
-        cookies = await booking_service.browser.context.cookies()
-        cookie_dict = {c['name']: c['value'] for c in cookies}
         api_client.update_cookies(cookie_dict)
         logger.info("Updated API client with authentication cookies")
         
@@ -85,8 +85,6 @@ class SessionRecovery:
                         )
                         if is_visible:
                             logger.info(f"Found Home button with selector: {selector}")
-                            await home_button.scroll_into_view_if_needed()
-                            await page.wait_for_timeout(500)
                             await home_button.click()
                             await page.wait_for_load_state('networkidle', timeout=30000)
                             await page.wait_for_timeout(2000)
@@ -0,0 +1,76 @@
+"""Tests for ShinagawaAPIClient request coalescing."""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.api_client import ShinagawaAPIClient
+
+CALLERS = 5
+
+
+def _run_concurrently(client, fetch):
+    """Call _single_flight from CALLERS threads while the first fetch is held.
+    
+    Returns one (result, exception) pair per caller.
+    """
+    def call():
+        try:
+            return client._single_flight(('date', 'key'), fetch), None
+        except Exception as e:
+            return None, e
+    
+    with ThreadPoolExecutor(max_workers=CALLERS) as executor:
+        futures = [executor.submit(call) for _ in range(CALLERS)]
+        return [future.result(timeout=5) for future in futures]
+
+
+def _held_fetch(outcome):
+    """Fetch held long enough for every caller to join, then runs outcome()."""
+    calls = []
+    
+    def fetch():
+        calls.append(1)
+        # Give the other callers time to find the in-flight future
+        time.sleep(0.2)
+        return outcome()
+    return fetch, calls
+
+
+def test_concurrent_callers_share_one_fetch():
+    client = ShinagawaAPIClient()
+    response = {'results': [], 'next': 0}
+    fetch, calls = _held_fetch(lambda: response)
+    
+    results = _run_concurrently(client, fetch)
+    
+    assert len(calls) == 1
+    assert all(result is response and error is None for result, error in results)
+    assert client._inflight == {}
+
+
+def test_concurrent_callers_get_the_same_exception():
+    client = ShinagawaAPIClient()
+    failure = RuntimeError('upstream error')
+    
+    def outcome():
+        raise failure
+    fetch, calls = _held_fetch(outcome)
+    
+    results = _run_concurrently(client, fetch)
+    
+    assert len(calls) == 1
+    assert all(result is None and error is failure for result, error in results)
+    assert client._inflight == {}
+
+
+def test_next_call_after_completion_fetches_again():
+    client = ShinagawaAPIClient()
+    calls = []
+    
+    def fetch():
+        calls.append(1)
+        return {'results': []}
+    
+    client._single_flight(('date', 'key'), fetch)
+    client._single_flight(('date', 'key'), fetch)
+    
+    assert len(calls) == 2
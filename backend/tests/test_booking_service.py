@@ -0,0 +1,148 @@
+"""Tests for BookingService background work."""
+import asyncio
+import types
+
+import pytest
+
+from app import booking_service as booking_service_module
+from app.booking_service import BookingService
+from app.database import MonitoringLog
+
+
+class FakeBrowser:
+    """Stands in for BrowserAutomation."""
+    
+    def __init__(self):
+        self.stopped = False
+    
+    async def stop(self):
+        self.stopped = True
+
+
+@pytest.fixture
+def committed(monkeypatch):
+    """Collect the batches passed to _commit_logs instead of writing them."""
+    batches = []
+    
+    async def commit_logs(logs):
+        batches.append(list(logs))
+    monkeypatch.setattr(BookingService, '_commit_logs', staticmethod(commit_logs))
+    return batches
+
+
+class SlowBrowser(FakeBrowser):
+    """book_slot that takes `duration`, optionally clicking the final 予約 first."""
+    
+    def __init__(self, duration, clicks_final_submit):
+        super().__init__()
+        self.duration = duration
+        self.clicks_final_submit = clicks_final_submit
+        self.cancelled = False
+        self.booking_handler = types.SimpleNamespace(final_submit_clicked=asyncio.Event())
+    
+    async def book_slot(self, slot_data):
+        self.booking_handler.final_submit_clicked.clear()
+        if self.clicks_final_submit:
+            self.booking_handler.final_submit_clicked.set()
+        try:
+            await asyncio.sleep(self.duration)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return {'success': True, 'reservation_number': '0123456789'}
+
+
+@pytest.fixture
+def booking_timeout(monkeypatch):
+    monkeypatch.setattr(booking_service_module.settings, 'booking_timeout', 0.05)
+
+
+def _service():
+    service = BookingService()
+    service.browser = FakeBrowser()
+    return service
+
+
+def _logs(count):
+    return [MonitoringLog(log_type='booking', message=f'log {i}') for i in range(count)]
+
+
+def test_queued_logs_are_flushed_on_cleanup(committed):
+    async def run():
+        service = _service()
+        logs = _logs(3)
+        for log in logs:
+            service._log(log)
+        # The writer is still inside its batch window
+        await asyncio.sleep(0)
+        await service.cleanup()
+        return service, logs
+    
+    service, logs = asyncio.run(run())
+    
+    assert [log for batch in committed for log in batch] == logs
+    assert service._log_queue.empty()
+    assert service.browser.stopped
+
+
+def test_logs_queued_without_a_writer_are_flushed_on_cleanup(committed):
+    async def run():
+        service = _service()
+        logs = _logs(2)
+        for log in logs:
+            service._log_queue.put_nowait(log)
+        await service.cleanup()
+        return logs
+    
+    logs = asyncio.run(run())
+    
+    assert committed == [logs]
+
+
+def test_logs_are_written_in_one_batch(committed, monkeypatch):
+    monkeypatch.setattr(booking_service_module, '_LOG_BATCH_WINDOW', 0.01)
+    
+    async def run():
+        service = _service()
+        logs = _logs(4)
+        for log in logs:
+            service._log(log)
+        await asyncio.sleep(0.05)
+        await service.cleanup()
+        return logs
+    
+    logs = asyncio.run(run())
+    
+    assert committed == [logs]
+
+
+def _book_with_deadline(browser):
+    async def run():
+        service = BookingService()
+        service.browser = browser
+        return await service._book_with_deadline({})
+    return asyncio.run(run())
+
+
+def test_deadline_cancels_booking_before_final_submit(booking_timeout):
+    browser = SlowBrowser(duration=1, clicks_final_submit=False)
+    
+    with pytest.raises(TimeoutError, match='before the final submit'):
+        _book_with_deadline(browser)
+    
+    assert browser.cancelled
+
+
+def test_deadline_does_not_cancel_after_final_submit(booking_timeout):
+    browser = SlowBrowser(duration=0.2, clicks_final_submit=True)
+    
+    result = _book_with_deadline(browser)
+    
+    assert result['reservation_number'] == '0123456789'
+    assert not browser.cancelled
+
+
+def test_booking_within_deadline_returns_result(booking_timeout):
+    browser = SlowBrowser(duration=0, clicks_final_submit=False)
+    
+    assert _book_with_deadline(browser)['success']